@@ -73,7 +73,10 @@ export default function CaretakerPortal() {
       const data = JSON.parse(event.data);
       console.log("WebSocket message received:", data);
 
-      if (data.type === "emergency_update") {
+      if (data.type === "ping") {
+        // Answer heartbeats so the server can tell a live connection from a dead one
+        ws.send(JSON.stringify({ type: "pong" }));
+      } else if (data.type === "emergency_update") {
         // Update state with the new emergency summary
         setEmergencySummary(data.data);
       } else if (data.type === "new_emergency") {
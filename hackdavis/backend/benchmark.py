@@ -0,0 +1,224 @@
+"""Offline benchmark for the pantry vision pipeline.
+
+Runs model.generate.scan over the images in data/img_to_predict with the
+Anthropic client replaced by a stub that answers from recorded responses (or
+synthetic ones) after a configurable simulated latency, so results are
+reproducible and cost nothing. Writes per-image stage timings, call counts,
+wall time and peak memory as JSON for comparison across commits.
+
+    python benchmark.py --latency 0.8 --output bench.json
+    python benchmark.py --detector synthetic --mode batched
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+BASE_DIR = Path(__file__).parent
+IMG_TO_PREDICT_DIR = BASE_DIR / "data" / "img_to_predict"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+SYNTHETIC_ITEMS = ["pasta sauce", "peanut butter", "ichiban ramen noodles", "chicken broth",
+                   "whole grain pasta elbows", "white beans", "dark chocolate peanut butter bar"]
+
+
+class StubMessages:
+    """Stands in for client.messages: sleeps for the simulated latency and returns a canned answer.
+
+    recorded is an optional {"inventory": "...", "labels": [...]} dict; labels
+    are handed out in order and cycled.
+    """
+
+    def __init__(self, latency, jitter, recorded=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.recorded = recorded or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {"inventory": 0, "classify": 0, "batch": 0}
+        self.label_index = 0
+
+    def _next_label(self, items):
+        with self.lock:
+            labels = self.recorded.get("labels")
+            if labels:
+                label = labels[self.label_index % len(labels)]
+                self.label_index += 1
+                return label
+            return self.random.choice(items + ["NULL"])
+
+    def create(self, model=None, max_tokens=None, messages=None, **kwargs):
+        content = messages[0]["content"]
+        prompt = content[-1]["text"]
+        images = sum(1 for block in content if block["type"] == "image")
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        time.sleep(delay)
+
+        if prompt.startswith("For each crop above"):
+            kind = "batch"
+            text = json.dumps({str(idx): self._next_label(SYNTHETIC_ITEMS) for idx in range(images)})
+        elif prompt.startswith("From this image"):
+            kind = "classify"
+            text = self._next_label(SYNTHETIC_ITEMS)
+        else:
+            kind = "inventory"
+            text = self.recorded.get("inventory", ", ".join(SYNTHETIC_ITEMS))
+        with self.lock:
+            self.calls[kind] += 1
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class StubClient:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def with_options(self, **kwargs):
+        return self
+
+
+class SyntheticEngine:
+    """Detector stand-in producing deterministic random boxes, for machines without YOLO weights."""
+
+    def __init__(self, boxes_per_image, latency, seed=0):
+        self.boxes_per_image = boxes_per_image
+        self.latency = latency
+        self.seed = seed
+
+    def predict(self, sources):
+        import numpy as np
+        from PIL import Image
+
+        results = []
+        for source in sources:
+            if isinstance(source, (str, Path)):
+                with Image.open(source) as image:
+                    width, height = image.size
+            else:
+                height, width = source.shape[:2]
+            rng = np.random.default_rng(self.seed)
+            x_min = rng.uniform(0, width * 0.8, self.boxes_per_image)
+            y_min = rng.uniform(0, height * 0.8, self.boxes_per_image)
+            x_max = np.minimum(width, x_min + rng.uniform(40, width * 0.2, self.boxes_per_image))
+            y_max = np.minimum(height, y_min + rng.uniform(40, height * 0.2, self.boxes_per_image))
+            boxes = np.stack([x_min, y_min, x_max, y_max], axis=1).astype(np.float32)
+            results.append((boxes, rng.uniform(0.01, 1.0, self.boxes_per_image).astype(np.float32)))
+            time.sleep(self.latency)
+        return results
+
+    def stats(self):
+        return {"backend": "synthetic"}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the pantry vision pipeline")
+    parser.add_argument("--images", nargs="*", default=None, help="Image names in data/img_to_predict (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Scans per image")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated model latency per call, seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Extra random latency per call, seconds")
+    parser.add_argument("--responses", type=str, default=None, help='Recorded responses JSON: {"inventory": "...", "labels": [...]}')
+    parser.add_argument("--mode", choices=["single", "batched"], default=None, help="Classification mode (default: CLASSIFY_MODE)")
+    parser.add_argument("--detector", choices=["yolo", "synthetic"], default="yolo", help="Real YOLO weights or synthetic boxes")
+    parser.add_argument("--synthetic-boxes", type=int, default=30, help="Boxes per image with --detector synthetic")
+    parser.add_argument("--synthetic-latency", type=float, default=0.05, help="Detection latency with --detector synthetic")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the classification/inventory caches and local classifier enabled")
+    parser.add_argument("--no-memory-pass", dest="memory_pass", action="store_false",
+                        help="Skip the untimed tracemalloc pass that measures peak Python memory")
+    parser.add_argument("--output", type=str, default=None, help="Write machine readable results to this JSON file")
+    args = parser.parse_args()
+
+    # Must be decided before model.generate is imported, since it reads them at import time
+    if not args.with_caches:
+        os.environ["CLASSIFY_CACHE"] = "0"
+        os.environ["INVENTORY_CACHE"] = "0"
+        os.environ["LOCAL_CLASSIFIER"] = "0"
+    if args.mode:
+        os.environ["CLASSIFY_MODE"] = args.mode
+    os.environ.setdefault("ANTHROPIC_API_KEY", "offline-benchmark")
+    sys.path.insert(0, str(BASE_DIR))
+    from model import generate
+
+    recorded = None
+    if args.responses:
+        with open(args.responses) as f:
+            recorded = json.load(f)
+    stub = StubMessages(args.latency, args.jitter, recorded)
+    generate.client = StubClient(stub)
+    if args.detector == "synthetic":
+        engine = SyntheticEngine(args.synthetic_boxes, args.synthetic_latency)
+        generate.get_engine = lambda: engine
+    # Keep benchmark renders out of data/result
+    generate.result_folder = tempfile.mkdtemp(prefix="pantry-bench-")
+
+    names = args.images or sorted(p.name for p in IMG_TO_PREDICT_DIR.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    runs = []
+    total_start = time.perf_counter()
+    for name in names:
+        for repeat in range(args.repeat):
+            timings = {}
+            calls_before = dict(stub.calls)
+            start = time.perf_counter()
+            detections, _ = generate.scan(name, timings=timings)
+            runs.append({
+                "image": name,
+                "repeat": repeat,
+                "wall_seconds": time.perf_counter() - start,
+                "stages": timings,
+                "calls": {kind: stub.calls[kind] - calls_before[kind] for kind in stub.calls},
+                "detections": len(detections),
+            })
+            print(f"{name} #{repeat}: {runs[-1]['wall_seconds']:.2f}s {json.dumps({k: round(v, 3) for k, v in timings.items()})}")
+    total_seconds = time.perf_counter() - total_start
+    calls = dict(stub.calls)
+    payload = generate.payload_stats()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Tracing allocations slows every scan down, so peak Python memory comes
+    # from a separate, untimed pass over each image
+    peak_traced = None
+    if args.memory_pass:
+        tracemalloc.start()
+        for name in names:
+            generate.scan(name)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(args) | {"classify_mode": generate.CLASSIFY_MODE},
+        "runs": runs,
+        "totals": {
+            "wall_seconds": total_seconds,
+            "calls": calls,
+            "python_peak_bytes": peak_traced,
+            # ru_maxrss is kilobytes on Linux and bytes on macOS
+            "max_rss_bytes": max_rss * (1 if sys.platform == "darwin" else 1024),
+            "payload": payload,
+        },
+    }
+    print(json.dumps(report["totals"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
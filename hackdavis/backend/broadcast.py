@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+BROADCAST_QUEUE_SIZE = int(os.getenv("BROADCAST_QUEUE_SIZE", "32"))
+BROADCAST_SEND_TIMEOUT = float(os.getenv("BROADCAST_SEND_TIMEOUT", "5"))
+# Seconds between heartbeat pings; a ping that cannot be sent in time evicts the client
+BROADCAST_PING_INTERVAL = float(os.getenv("BROADCAST_PING_INTERVAL", "20"))
+# A client that answers pings but has been silent this long is treated as a
+# half-open socket (writes still succeed into the kernel buffer) and evicted
+BROADCAST_IDLE_TIMEOUT = float(os.getenv("BROADCAST_IDLE_TIMEOUT", "60"))
+LATENCY_SAMPLES = 512
+
+
+class BroadcastClient:
+    def __init__(self, websocket, queue_size):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+        self.connected_at = time.time()
+        self.last_seen = time.time()
+        # Set once the client has answered a ping; older clients that never do are not idle-evicted
+        self.answers_pings = False
+        self.sent = 0
+        self.closed = False
+
+
+class BroadcastHub:
+    """Fan-out of JSON messages to WebSocket clients.
+
+    Every message is serialized once and put on each client's bounded queue;
+    a writer task per client does the actual sends with a timeout. A client
+    whose queue is full or whose send fails or times out is evicted, so one
+    slow or dead socket never holds up the others. Clients that answer the
+    heartbeat ping with {"type": "pong"} are also evicted once they go quiet
+    for idle_timeout, which catches half-open sockets.
+    """
+
+    def __init__(self, queue_size=BROADCAST_QUEUE_SIZE, send_timeout=BROADCAST_SEND_TIMEOUT, ping_interval=BROADCAST_PING_INTERVAL,
+                 idle_timeout=BROADCAST_IDLE_TIMEOUT):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.clients = {}
+        self.heartbeat = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {"connected": 0, "broadcasts": 0, "messages_sent": 0, "evicted_slow": 0, "evicted_failed": 0, "evicted_idle": 0}
+
+    def connect(self, websocket):
+        """Register an accepted websocket and start its writer task."""
+        client = BroadcastClient(websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._writer(client))
+        self.clients[id(websocket)] = client
+        self.counters["connected"] += 1
+        if self.ping_interval and (self.heartbeat is None or self.heartbeat.done()):
+            self.heartbeat = asyncio.create_task(self._heartbeat())
+        return client
+
+    def received(self, client, text):
+        """Record an incoming message; {"type": "pong"} marks the client as answering heartbeats."""
+        client.last_seen = time.time()
+        if not client.answers_pings:
+            try:
+                client.answers_pings = json.loads(text).get("type") == "pong"
+            except (ValueError, AttributeError):
+                pass
+
+    async def disconnect(self, client, close=False):
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.pop(id(client.websocket), None)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        if close:
+            try:
+                await asyncio.wait_for(client.websocket.close(), self.send_timeout)
+            except Exception:
+                pass
+
+    @staticmethod
+    def encode(message):
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def send(self, client, message):
+        """Queue a message for one client. Returns False if the client was evicted as a slow consumer."""
+        return self._enqueue(client, message if isinstance(message, str) else self.encode(message))
+
+    def broadcast(self, message):
+        """Queue a message for every client; the payload is serialized once. Returns the number of clients reached."""
+        text = message if isinstance(message, str) else self.encode(message)
+        self.counters["broadcasts"] += 1
+        return sum(1 for client in list(self.clients.values()) if self._enqueue(client, text))
+
+    def _enqueue(self, client, text):
+        if client.closed:
+            return False
+        try:
+            client.queue.put_nowait((time.perf_counter(), text))
+            return True
+        except asyncio.QueueFull:
+            print(f"Evicting slow websocket client ({client.queue.qsize()} messages queued)")
+            self.counters["evicted_slow"] += 1
+            asyncio.create_task(self.disconnect(client, close=True))
+            return False
+
+    async def _writer(self, client):
+        try:
+            while True:
+                queued_at, text = await client.queue.get()
+                try:
+                    await asyncio.wait_for(client.websocket.send_text(text), self.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Evicting websocket client after failed send: {e!r}")
+                    self.counters["evicted_failed"] += 1
+                    await self.disconnect(client, close=True)
+                    return
+                # Time from broadcast to delivery, including time spent queued
+                self.latencies.append(time.perf_counter() - queued_at)
+                client.sent += 1
+                self.counters["messages_sent"] += 1
+        except asyncio.CancelledError:
+            pass
+
+    async def _heartbeat(self):
+        while self.clients:
+            await asyncio.sleep(self.ping_interval)
+            if self.idle_timeout:
+                cutoff = time.time() - self.idle_timeout
+                for client in list(self.clients.values()):
+                    if client.answers_pings and client.last_seen < cutoff:
+                        print("Evicting websocket client that stopped answering pings")
+                        self.counters["evicted_idle"] += 1
+                        await self.disconnect(client, close=True)
+            self.broadcast({"type": "ping", "timestamp": datetime.now().isoformat()})
+
+    async def close(self):
+        for client in list(self.clients.values()):
+            await self.disconnect(client, close=True)
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        depths = [client.queue.qsize() for client in self.clients.values()]
+        return {
+            **self.counters,
+            "clients": len(self.clients),
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_total": sum(depths),
+            "send_latency_ms_avg": sum(latencies) * 1000 / len(latencies) if latencies else 0.0,
+            "send_latency_ms_p95": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+            "send_latency_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+        }
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+
+from helper import load_env
+
+load_env()
+
+SUPABASE_URL = os.getenv("URL")
+SUPABASE_SERVICE_KEY = os.getenv("service_role")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
+
+INDEX_NAME = os.getenv("RAG_INDEX_NAME", "hackdavis-rag-index")
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIM = 768
+LLM_MODEL = os.getenv("RAG_LLM_MODEL", "llama-3.3-70b")
+
+
+class ClientRegistry:
+    """Application-scoped RAG/LLM/database clients, built once and shared by every request.
+
+    Each client keeps its own HTTP connection pool, so reusing them saves the
+    construction and TLS handshakes on the emergency path. Clients are built
+    lazily, or all at once by startup().
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._clients = {}
+        # Pinecone indexes known to exist, so list_indexes() is called at most once per name
+        self.known_indexes = set()
+
+    def _get(self, name, build):
+        with self.lock:
+            if name not in self._clients:
+                start = time.perf_counter()
+                self._clients[name] = build()
+                print(f"Initialized {name} client in {time.perf_counter() - start:.2f}s")
+            return self._clients[name]
+
+    @property
+    def supabase(self):
+        from supabase import create_client
+        return self._get("supabase", lambda: create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY))
+
+    @property
+    def embeddings(self):
+        from langchain_ollama import OllamaEmbeddings
+        return self._get("embeddings", lambda: OllamaEmbeddings(model=EMBEDDING_MODEL))
+
+    @property
+    def pinecone(self):
+        from pinecone import Pinecone
+        return self._get("pinecone", lambda: Pinecone(api_key=PINECONE_API_KEY))
+
+    @property
+    def vector_store(self):
+        """The shared vector store over INDEX_NAME; filter per resident at query time."""
+        from langchain_pinecone import PineconeVectorStore
+
+        def build():
+            self.ensure_index(INDEX_NAME)
+            return PineconeVectorStore(index=self.pinecone.Index(INDEX_NAME), embedding=self.embeddings, text_key="text")
+        return self._get("vector_store", build)
+
+    @property
+    def llm(self):
+        from langchain_cerebras import ChatCerebras
+        return self._get("llm", lambda: ChatCerebras(api_key=CEREBRAS_API_KEY, model=LLM_MODEL))
+
+    def ensure_index(self, index_name):
+        """Create the Pinecone index if it does not exist yet; only the first call per name hits the API."""
+        from pinecone import ServerlessSpec
+
+        with self.lock:
+            if index_name in self.known_indexes:
+                return
+            existing = set(self.pinecone.list_indexes().names())
+            if index_name not in existing:
+                self.pinecone.create_index(
+                    name=index_name,
+                    dimension=EMBEDDING_DIM,
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud='aws', region='us-east-1')
+                )
+                existing.add(index_name)
+                print(f"Created pinecone index {index_name}")
+            self.known_indexes.update(existing)
+
+    def startup(self):
+        """Build every client up front and report their health, so the first emergency pays for none of it."""
+        for name in ("supabase", "embeddings", "pinecone", "vector_store", "llm"):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                print(f"Error initializing {name} client: {e}")
+        status = self.health()
+        print(f"Client health: {status}")
+        return status
+
+    def health(self):
+        """Cheap round trip per remote service; returns {service: {"ok": bool, "ms": float, "error"?: str}}."""
+        checks = {
+            "supabase": lambda: self.supabase.table("residents").select("id").limit(1).execute(),
+            "pinecone": lambda: self.pinecone.describe_index(INDEX_NAME),
+            "embeddings": lambda: self.embeddings.embed_query("health check"),
+        }
+        status = {}
+        for name, check in checks.items():
+            start = time.perf_counter()
+            try:
+                check()
+                status[name] = {"ok": True}
+            except Exception as e:
+                status[name] = {"ok": False, "error": str(e)}
+            status[name]["ms"] = (time.perf_counter() - start) * 1000
+        with self.lock:
+            status["initialized"] = sorted(self._clients)
+        return status
+
+
+registry = None
+registry_lock = threading.Lock()
+
+
+def get_clients():
+    """Return the process-wide client registry, creating it on first use."""
+    global registry
+    with registry_lock:
+        if registry is None:
+            registry = ClientRegistry()
+        return registry
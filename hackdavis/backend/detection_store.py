@@ -0,0 +1,277 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from model.boxes import GridIndex
+from model.labels import NORMALIZATION_VERSION, normalize_label
+
+BASE_DIR = Path(__file__).parent
+DETECTION_DB_PATH = os.getenv("DETECTION_DB_PATH", str(BASE_DIR / "data" / "detections.sqlite3"))
+# Images whose spatial index is kept in memory
+SPATIAL_INDEX_ENTRIES = int(os.getenv("SPATIAL_INDEX_ENTRIES", "64"))
+# Largest pixel coordinate accepted in an edited box
+MAX_BOX_COORD = int(os.getenv("MAX_BOX_COORD", "20000"))
+
+
+class StaleVersionError(Exception):
+    """A batch edit was based on an older version of the detection set than the stored one."""
+
+    def __init__(self, current_version):
+        super().__init__(f"Detection set has changed (current version {current_version})")
+        self.current_version = current_version
+
+
+def check_box(box):
+    """Validate an edited box and return it as stored JSON; raises ValueError for malformed, inverted or out of range boxes."""
+    if not isinstance(box, (list, tuple)) or len(box) != 4:
+        raise ValueError(f"box must be [xA, yA, xB, yB], got {box!r}")
+    try:
+        box = [int(v) for v in box]
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"box coordinates must be numbers, got {box!r}") from None
+    if not all(0 <= v <= MAX_BOX_COORD for v in box):
+        raise ValueError(f"box coordinates must be between 0 and {MAX_BOX_COORD}, got {box!r}")
+    if box[2] <= box[0] or box[3] <= box[1]:
+        raise ValueError(f"box must have xA < xB and yA < yB, got {box!r}")
+    return json.dumps(box)
+
+
+class DetectionStore:
+    """Per-image detection sets in SQLite (WAL), shared safely by API workers and scan processes.
+
+    Every write bumps the image's version number inside the same transaction,
+    so versions only ever increase and can be used as ETags.
+    """
+
+    def __init__(self, path=DETECTION_DB_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS images (
+            image TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS detections (
+            image TEXT NOT NULL,
+            det_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            box TEXT NOT NULL,
+            phash TEXT,
+            PRIMARY KEY (image, det_id))""")
+        # Normalized label -> number of detections, maintained by every write so
+        # pantry summaries and recipes never have to scan the detections
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS label_counts (
+            image TEXT NOT NULL,
+            label TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (image, label))""")
+        # user_version records the normalization rules the counts were built with
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != NORMALIZATION_VERSION:
+            self._rebuild_counts()
+
+    def _rebuild_counts(self):
+        """Fill label_counts from scratch, for new databases or after the normalization rules changed."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM label_counts")
+                for image, label in self.conn.execute("SELECT image, label FROM detections").fetchall():
+                    self._count(self.conn, image, label, 1)
+                self.conn.execute(f"PRAGMA user_version = {int(NORMALIZATION_VERSION)}")
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _count(conn, image, label, delta):
+        """Adjust the count of a label inside the caller's transaction; NULL labels are not counted."""
+        label = normalize_label(label)
+        if not label:
+            return
+        conn.execute("""INSERT INTO label_counts (image, label, count) VALUES (?, ?, ?)
+            ON CONFLICT(image, label) DO UPDATE SET count = count + excluded.count""", (image, label, delta))
+        conn.execute("DELETE FROM label_counts WHERE image = ? AND label = ? AND count <= 0", (image, label))
+
+    @staticmethod
+    def _label_of(conn, image, det_id):
+        row = conn.execute("SELECT label FROM detections WHERE image = ? AND det_id = ?", (image, det_id)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, image, apply):
+        """Run apply(conn) and bump the image version in one transaction; returns the new version."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = apply(self.conn)
+                self.conn.execute("""INSERT INTO images (image, version, updated_at) VALUES (?, 1, ?)
+                    ON CONFLICT(image) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at""",
+                                  (image, time.time()))
+                version = self.conn.execute("SELECT version FROM images WHERE image = ?", (image,)).fetchone()[0]
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return version, result
+
+    def version(self, image):
+        """Current version of an image's detection set, 0 if it has never been written."""
+        with self.lock:
+            row = self.conn.execute("SELECT version FROM images WHERE image = ?", (image,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _detections(conn, image):
+        detections = {}
+        for det_id, label, box, phash in conn.execute("SELECT det_id, label, box, phash FROM detections WHERE image = ? ORDER BY det_id", (image,)).fetchall():
+            detections[det_id] = {"label": label, "box": json.loads(box)}
+            if phash:
+                detections[det_id]["phash"] = phash
+        return detections
+
+    def get(self, image):
+        """Return (version, {id: {"label", "box"}}) read from one consistent snapshot."""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                row = self.conn.execute("SELECT version FROM images WHERE image = ?", (image,)).fetchone()
+                detections = self._detections(self.conn, image)
+            finally:
+                self.conn.execute("COMMIT")
+        return (row[0] if row else 0), detections
+
+    def add(self, image, label, box, det_id=None, phash=None):
+        """Insert (or overwrite) one detection; returns (version, id). A new id is allocated when det_id is None."""
+        def apply(conn):
+            new_id = det_id
+            if new_id is None:
+                new_id = conn.execute("SELECT COALESCE(MAX(det_id), 0) + 1 FROM detections WHERE image = ?", (image,)).fetchone()[0]
+            else:
+                replaced = self._label_of(conn, image, new_id)
+                if replaced is not None:
+                    self._count(conn, image, replaced, -1)
+            self._count(conn, image, label, 1)
+            conn.execute("INSERT OR REPLACE INTO detections (image, det_id, label, box, phash) VALUES (?, ?, ?, ?, ?)",
+                         (image, new_id, label, json.dumps([int(v) for v in box]), phash))
+            return new_id
+        return self._write(image, apply)
+
+    def remove(self, image, det_id):
+        """Delete one detection; raises KeyError if it does not exist. Returns the new version."""
+        def apply(conn):
+            label = self._label_of(conn, image, det_id)
+            if label is None:
+                raise KeyError(det_id)
+            conn.execute("DELETE FROM detections WHERE image = ? AND det_id = ?", (image, det_id))
+            self._count(conn, image, label, -1)
+        return self._write(image, apply)[0]
+
+    def replace(self, image, detections):
+        """Replace an image's whole detection set (e.g. with fresh scan results). Returns the new version."""
+        def apply(conn):
+            conn.execute("DELETE FROM detections WHERE image = ?", (image,))
+            conn.execute("DELETE FROM label_counts WHERE image = ?", (image,))
+            for d in detections.values():
+                self._count(conn, image, d["label"], 1)
+            conn.executemany("INSERT INTO detections (image, det_id, label, box, phash) VALUES (?, ?, ?, ?, ?)",
+                             [(image, int(det_id), d["label"], json.dumps([int(v) for v in d["box"]]), d.get("phash"))
+                              for det_id, d in detections.items()])
+        return self._write(image, apply)[0]
+
+    def apply(self, image, base_version, operations):
+        """Apply a batch of edits atomically; all of them or none are applied.
+
+        operations is a list of dicts with "op" one of add (label, box, optional
+        id), relabel (id, label), move (id, box) or delete (id). Raises
+        StaleVersionError when base_version is not the current version,
+        KeyError for unknown ids and ValueError for malformed operations
+        (including a missing id). Returns (version, detections) as written by
+        this batch, read inside its transaction.
+        """
+        def apply(conn):
+            row = conn.execute("SELECT version FROM images WHERE image = ?", (image,)).fetchone()
+            current = row[0] if row else 0
+            if current != base_version:
+                raise StaleVersionError(current)
+            next_id = conn.execute("SELECT COALESCE(MAX(det_id), 0) + 1 FROM detections WHERE image = ?", (image,)).fetchone()[0]
+            for operation in operations:
+                op, det_id = operation.get("op"), operation.get("id")
+                if op in ("relabel", "move", "delete") and det_id is None:
+                    raise ValueError(f"{op} needs an id")
+                if op == "add":
+                    if det_id is None:
+                        det_id = next_id
+                    elif conn.execute("SELECT 1 FROM detections WHERE image = ? AND det_id = ?", (image, det_id)).fetchone():
+                        raise ValueError(f"Detection {det_id} already exists")
+                    if not operation.get("label"):
+                        raise ValueError("add needs a label")
+                    conn.execute("INSERT INTO detections (image, det_id, label, box) VALUES (?, ?, ?, ?)",
+                                 (image, det_id, operation["label"], check_box(operation.get("box"))))
+                    self._count(conn, image, operation["label"], 1)
+                    next_id = max(next_id, det_id + 1)
+                elif op == "relabel":
+                    if not operation.get("label"):
+                        raise ValueError("relabel needs a label")
+                    old_label = self._label_of(conn, image, det_id)
+                    cursor = conn.execute("UPDATE detections SET label = ? WHERE image = ? AND det_id = ?", (operation["label"], image, det_id))
+                    if old_label is not None:
+                        self._count(conn, image, old_label, -1)
+                        self._count(conn, image, operation["label"], 1)
+                elif op == "move":
+                    # A moved box no longer shows the crop its hash was computed from
+                    cursor = conn.execute("UPDATE detections SET box = ?, phash = NULL WHERE image = ? AND det_id = ?",
+                                          (check_box(operation.get("box")), image, det_id))
+                elif op == "delete":
+                    old_label = self._label_of(conn, image, det_id)
+                    cursor = conn.execute("DELETE FROM detections WHERE image = ? AND det_id = ?", (image, det_id))
+                    if old_label is not None:
+                        self._count(conn, image, old_label, -1)
+                else:
+                    raise ValueError(f"Unknown operation {op!r}")
+                if op != "add" and cursor.rowcount == 0:
+                    raise KeyError(det_id)
+            return self._detections(conn, image)
+        return self._write(image, apply)
+
+    def label_counts(self, image):
+        """The image's ingredient multiset as {normalized label: count}, read from the maintained index."""
+        with self.lock:
+            rows = self.conn.execute("SELECT label, count FROM label_counts WHERE image = ? ORDER BY label", (image,)).fetchall()
+        return dict(rows)
+
+    def spatial_index(self, image):
+        """Return (version, detections, GridIndex) for an image.
+
+        The index is rebuilt only when the stored version has moved on, which
+        also picks up writes made by scan worker processes.
+        """
+        version = self.version(image)
+        with self.lock:
+            cached = self.indexes.get(image)
+            if cached is not None and cached[0] == version:
+                self.indexes.move_to_end(image)
+                return cached
+        version, detections = self.get(image)
+        index = GridIndex()
+        for det_id, detection in detections.items():
+            index.insert(det_id, detection["box"])
+        with self.lock:
+            self.indexes[image] = (version, detections, index)
+            self.indexes.move_to_end(image)
+            while len(self.indexes) > SPATIAL_INDEX_ENTRIES:
+                self.indexes.popitem(last=False)
+        return version, detections, index
+
+    def latest_image(self):
+        """The most recently written image, if any."""
+        with self.lock:
+            row = self.conn.execute("SELECT image FROM images ORDER BY updated_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
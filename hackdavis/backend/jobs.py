@@ -0,0 +1,189 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from uploads import DATA_DIR, is_video, load_result, result_name_for, save_result
+
+# Number of pantry scans that may run at the same time. Each worker is a
+# separate process so detection and image work never blocks the API event loop.
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "2"))
+
+
+def warm_worker():
+    """Load and warm the detector once per worker process instead of on the first scan."""
+    from model.engine import get_engine
+    get_engine().load()
+
+
+def run_scan(job_id, filename, progress, previous=None):
+    """Worker entry point: run the full pipeline for one uploaded image (named by content hash).
+
+    With the previous detection set of the same pantry the scan is
+    incremental and returns a diff alongside the detections.
+    """
+    from model.generate import scan
+    from detection_store import DetectionStore
+
+    def on_progress(done, total):
+        progress[job_id] = (done, total)
+
+    progress[job_id] = (0, None)
+    # The job id doubles as the crop namespace so concurrent scans never share a folder
+    try:
+        detections, diff = scan(filename, job_id, on_progress=on_progress, previous=previous)
+    except Exception as e:
+        # API errors (e.g. a bad key) do not survive pickling back to the parent; send a plain one
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    save_result(filename, detections)
+    # Publish the fresh scan to the editable per-image detection set
+    DetectionStore().replace(filename, detections)
+    return detections, diff
+
+
+def run_video_scan(job_id, filename, progress, previous=None):
+    """Worker entry point for a video sweep: track items across frames, then store the result like run_scan.
+
+    previous is ignored; boxes of a sweep live in different frames, so there is
+    nothing to reuse incrementally.
+    """
+    from model.generate import scan_video, pred_folder, result_folder
+    from detection_store import DetectionStore
+
+    def on_progress(done, total):
+        progress[job_id] = (done, total)
+
+    progress[job_id] = (0, None)
+    try:
+        detections = scan_video(os.path.join(pred_folder, filename), output_path=os.path.join(result_folder, result_name_for(filename)),
+                                on_progress=on_progress)
+    except Exception as e:
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    save_result(filename, detections)
+    DetectionStore().replace(filename, detections)
+    return detections, None
+
+
+class ScanJobQueue:
+    """Bounded process pool running run_all, with job status queryable by content name.
+
+    Images are identified by their content hash, so a repeat upload attaches
+    to the running job or reuses the stored result instead of scanning again.
+    """
+
+    def __init__(self, max_workers=SCAN_WORKERS):
+        self.max_workers = max_workers
+        self.jobs: dict = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.manager = None
+        self.progress = None
+
+    def _ensure_started(self):
+        # Worker processes are only spawned once the first scan arrives
+        context = multiprocessing.get_context("spawn")
+        if self.manager is None:
+            self.manager = context.Manager()
+            self.progress = self.manager.dict()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=warm_worker)
+
+    def _submit(self, *args):
+        """Submit to the pool, replacing it once if a crashed worker (OOM, segfault, failed warm-up) left it broken."""
+        self._ensure_started()
+        try:
+            return self.executor.submit(*args)
+        except BrokenProcessPool:
+            print("Scan worker pool is broken; starting a new one")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self._ensure_started()
+            return self.executor.submit(*args)
+
+    @staticmethod
+    def new_job(filename, status="queued", result=None):
+        return {
+            "job_id": uuid.uuid4().hex,
+            "filename": filename,
+            "status": status,
+            "boxes_done": 0,
+            "boxes_total": None,
+            "result": result,
+            "diff": None,
+            "error": None,
+            "reused": result is not None,
+            "submitted_at": time.time(),
+            "finished_at": time.time() if result is not None else None,
+        }
+
+    def _stored_job(self, filename):
+        """Rebuild a completed job from a result persisted by an earlier scan, if any."""
+        result = load_result(filename)
+        if result is None or not (DATA_DIR / "result" / result_name_for(filename)).exists():
+            return None
+        job = self.new_job(filename, "completed", result)
+        job["boxes_done"] = job["boxes_total"] = len(result)
+        self.jobs[filename] = job
+        return job
+
+    def submit(self, filename, previous=None):
+        with self.lock:
+            job = self.jobs.get(filename) or self._stored_job(filename)
+            if job is not None and job["status"] != "error":
+                return self.view(job)
+            job = self.new_job(filename)
+            self.jobs[filename] = job
+            target = run_video_scan if is_video(filename) else run_scan
+            try:
+                future = self._submit(target, job["job_id"], filename, self.progress, previous)
+            except Exception as e:
+                # Recorded as failed so the next upload of these bytes tries again
+                print(f"Could not submit scan for {filename}: {e!r}")
+                job["status"] = "error"
+                job["error"] = f"{type(e).__name__}: {e}"
+                job["finished_at"] = time.time()
+                return self.view(job)
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return self.view(job)
+
+    def _finish(self, job, future):
+        with self.lock:
+            try:
+                job["result"], job["diff"] = future.result()
+                job["status"] = "completed"
+            except Exception as e:
+                print(f"Scan {job['job_id']} for {job['filename']} failed: {e}")
+                job["status"] = "error"
+                job["error"] = str(e)
+            job["finished_at"] = time.time()
+            self._sync_progress(job)
+            self.progress.pop(job["job_id"], None)
+
+    def _sync_progress(self, job):
+        progress = self.progress.get(job["job_id"]) if self.progress is not None else None
+        if progress is None:
+            return
+        if job["status"] == "queued":
+            job["status"] = "processing"
+        job["boxes_done"], job["boxes_total"] = progress
+
+    def get(self, filename):
+        with self.lock:
+            job = self.jobs.get(filename) or self._stored_job(filename)
+            if job is None:
+                return None
+            if job["status"] in ("queued", "processing"):
+                self._sync_progress(job)
+            return self.view(job)
+
+    @staticmethod
+    def view(job):
+        return dict(job)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.manager.shutdown()
@@ -1,27 +1,33 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Any, List
 import threading
 import os
-from supabase import create_client, Client
+from supabase import Client
 import shutil
 from helper import load_env
-from model.generate import run_all
+from model.generate import render_detections
+from jobs import ScanJobQueue
+from uploads import UploadStore, is_video, load_result, result_name_for
+from detection_store import DetectionStore, StaleVersionError
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timezone
 
 from pathlib import Path
 import math
+import json
 import uuid
 from pdf_generator_cli import create_medical_history_pdf
-from rag import load_and_split_pdf, init_pinecone_index, upload_vectors, get_docsearch_for_resident
-from langchain_ollama import OllamaEmbeddings
+from rag import load_and_split_pdf, upload_vectors, stuff_prompt
+from clients import get_clients, INDEX_NAME
+from broadcast import BroadcastHub
+from summary_cache import SummaryCache
+from repository import (ResidentRepository, EmergencyLogRepository, NonEmergencyLogRepository,
+                        MedicalHistoryRepository)
 import tempfile
-from langchain.chains.question_answering import load_qa_chain
-from langchain_cerebras import ChatCerebras
-from langchain_pinecone import PineconeVectorStore
 import asyncio
 
 from recipe_generator import get_dict, text_to_dict
@@ -52,7 +58,14 @@ load_env()
 SUPABASE_URL = os.getenv("URL")
 SUPABASE_SERVICE_KEY = os.getenv("service_role")
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+clients = get_clients()
+supabase: Client = clients.supabase
+residents = ResidentRepository(supabase)
+emergency_logs = EmergencyLogRepository(supabase)
+non_emergency_logs = NonEmergencyLogRepository(supabase)
+medical_histories = MedicalHistoryRepository(supabase)
+# Recipe generation is one LLM call; give it longer than a database query
+RECIPE_TIMEOUT = float(os.getenv("RECIPE_TIMEOUT", "60"))
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
 
@@ -89,10 +102,10 @@ class CallRequest(BaseModel):
     phoneNumber: str
 
 @app.post("/login")
-def login(request: LoginRequest):
+async def login(request: LoginRequest):
     try:
         # Query the Supabase table for the resident with the given name and password
-        result = supabase.table("residents").select("*").eq("name", request.name).eq("password", request.password).execute()
+        result = await residents.find_by_credentials(request.name, request.password)
         if result.data and len(result.data) > 0:
             resident = result.data[0]
             agent_id = resident.get("agent_id")
@@ -122,11 +135,11 @@ def login(request: LoginRequest):
 
 # Modify the assign-caretaker endpoint
 @app.post("/assign-caretaker")
-def assign_caretaker(resident_info: ResidentInfo):
+async def assign_caretaker(resident_info: ResidentInfo):
     print("I am here")
     # First check if resident already exists in Supabase
     try:
-        existing_resident = supabase.table("residents").select("*").eq("name", resident_info.name).execute()
+        existing_resident = await residents.find_by_name(resident_info.name)
         
         # If resident exists, return the existing data
         if existing_resident.data and len(existing_resident.data) > 0:
@@ -159,7 +172,7 @@ def assign_caretaker(resident_info: ResidentInfo):
         }
         
         # Insert into Supabase table
-        result = supabase.table("residents").insert(resident_data).execute()
+        result = await residents.insert(resident_data)
         print(f"Supabase insertion result: {result}")
         
         # Check for errors in the response
@@ -189,64 +202,100 @@ def assign_caretaker(resident_info: ResidentInfo):
         return {"message": "Caretaker assigned but database storage failed", "error": str(e)}
 
     
-processing_status: Dict[str, str] = {}
+scan_jobs = ScanJobQueue()
+uploads = UploadStore()
 
-def process_image(filename: str):
-    """
-    Your Python function to process the image
-    This is where you would implement your actual image processing logic
-    """
-    try:
-        run_all(filename, "crop1")
-        
-        # Update status
-        processing_status[filename] = "completed"
-    except Exception as e:
-        processing_status[filename] = f"error: {str(e)}"
+@app.on_event("startup")
+async def init_clients():
+    # Build the RAG/LLM clients before the first request instead of on the emergency path
+    await run_in_threadpool(clients.startup)
+
+@app.get("/health")
+async def health():
+    status = await run_in_threadpool(clients.health)
+    ok = all(check["ok"] for name, check in status.items() if name != "initialized")
+    return JSONResponse(status_code=200 if ok else 503, content={"ok": ok, **status})
+
+@app.on_event("shutdown")
+def shutdown_scan_jobs():
+    scan_jobs.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_broadcast_hub():
+    await broadcast_hub.close()
 
 @app.post("/upload-image/")
-async def upload_image(file: UploadFile = File(...)):
-    # Save the uploaded file
-    # file_path = os.path.join(r"C:\Users\Sai\Documents\GitHub\Hackathon-Davis\hackdavis\backend\data\img_to_predict", file.filename)
-    # with open(file_path, "wb") as buffer:
-    #     shutil.copyfileobj(file.file, buffer)
-    
-    # # Set initial status
-    # processing_status[file.filename] = "processing"
-    
-    # # Start processing in background
-    # thread = threading.Thread(
-    #     target=process_image,
-    #     args=(file.filename,)
-    # )
-    # thread.start()
-    
-    return {"filename": file.filename, "status": "success"}
+async def upload_image(file: UploadFile = File(...), pantry_id: Optional[str] = Form(None)):
+    # Stream and hash the upload off the event loop; identical bytes reuse the earlier scan
+    filename = os.path.basename(file.filename)
+    content_name, is_new = await run_in_threadpool(uploads.store, file.file, filename)
+
+    # A re-scan of a known pantry only classifies boxes that changed since its last scan
+    previous = None
+    if pantry_id:
+        previous_content = uploads.latest_scan(pantry_id)
+        if previous_content and previous_content != content_name:
+            # The stored set includes the caretaker's corrections to the previous scan
+            version, previous = detection_store.get(previous_content)
+            if version == 0:
+                previous = load_result(previous_content)
+        uploads.set_latest_scan(pantry_id, content_name)
+
+    job = scan_jobs.submit(content_name, previous)
+    return {
+        "filename": filename,
+        "content_name": content_name,
+        "status": "success",
+        "job_id": job["job_id"],
+        "reused": not is_new or job["status"] != "queued",
+    }
+
+@app.post("/upload-video/")
+async def upload_video(file: UploadFile = File(...)):
+    """Scan a pantry sweep video; poll /get-processed-image with the returned filename like an image scan"""
+    filename = os.path.basename(file.filename)
+    if not is_video(filename):
+        raise HTTPException(status_code=400, detail="Expected a video file")
+    content_name, is_new = await run_in_threadpool(uploads.store, file.file, filename)
+    job = scan_jobs.submit(content_name)
+    return {
+        "filename": filename,
+        "content_name": content_name,
+        "status": "success",
+        "job_id": job["job_id"],
+        "reused": not is_new or job["status"] != "queued",
+    }
 
 @app.get("/get-processed-image/{filename}")
 async def get_processed_image(filename: str):
-    # Check if file exists and processing is complete
-    status = processing_status.get(filename, "not_found")
+    content_name = uploads.resolve(filename)
+    job = scan_jobs.get(content_name)
     
-    if status == "not_found":
+    if job is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    if status == "processing":
-        return {"status": "processing"}
+    if job["status"] in ("queued", "processing"):
+        return {
+            "status": "processing",
+            "job_id": job["job_id"],
+            "job_status": job["status"],
+            "boxes_done": job["boxes_done"],
+            "boxes_total": job["boxes_total"],
+        }
     
-    if status.startswith("error"):
-        raise HTTPException(status_code=500, detail=status)
+    if job["status"] == "error":
+        raise HTTPException(status_code=500, detail=f"error: {job['error']}")
     
     # Return the processed image
-    file_path = RESULT_DIR / filename
+    file_path = RESULT_DIR / result_name_for(content_name)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Processed file not found")
     
-    return {"filename": filename, "status": "processed"}
+    return {"filename": filename, "content_name": content_name, "status": "processed", "job_id": job["job_id"], "reused": job["reused"], "detections": job["result"], "diff": job["diff"]}
 
 @app.get("/processed-images/{filename}")
 async def serve_processed_image(filename: str):
-    file_path = RESULT_DIR / filename
+    file_path = RESULT_DIR / result_name_for(uploads.resolve(filename))
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
     
@@ -254,42 +303,77 @@ async def serve_processed_image(filename: str):
 
 @app.get("/original-image/{filename}")
 async def serve_original_image(filename: str):  # Renamed function
-    file_path = IMG_TO_PREDICT_DIR / filename
+    file_path = IMG_TO_PREDICT_DIR / uploads.resolve(filename)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
     
     return FileResponse(str(file_path))
 
 
-detection_data = {1: {'label': 'pasta sauce', 'box': [290, 379, 396, 590]}, 2: {'label': 'pasta sauce', 'box': [391, 387, 497, 591]}, 3: {'label': 'peanut butter', 'box': [192, 683, 283, 852]}, 4: {'label': 'ichiban ramen noodles', 'box': [456, 55, 557, 288]}, 5: {'label': 'dark chocolate peanut butter bar', 'box': [490, 382, 597, 601]}, 6: {'label': 'peanut butter', 'box': [193, 620, 289, 772]}, 7: {'label': 'chicken broth', 'box': [329, 0, 465, 242]}, 8: {'label': 'whole grain pasta elbows', 'box': [35, 216, 136, 248]}, 9: {'label': 'chicken broth', 'box': [11, 617, 600, 897]}, 10: {'label': 'white beans', 'box': [181, 352, 303, 581]}, 11: {'label': 'whole grain pasta elbows', 'box': [157, 21, 327, 290]}, 12: {'label': 'chicken broth', 'box': [285, 624, 348, 851]}, 13: {'label': 'whole grain pasta elbows', 'box': [0, 114, 165, 288]}, 14: {'label': 'dark chocolate peanut butter bar', 'box': [485, 382, 598, 602]}, 15: {'label': 'dark chocolate peanut butter bar', 'box': [343, 622, 408, 849]}, 16: {'label': 'whole grain pasta elbows', 'box': [0, 0, 599, 766]}, 17: {'label': 'white beans', 'box': [184, 357, 303, 579]}, 18: {'label': 'ichiban ramen noodles', 'box': [458, 33, 595, 286]}, 19: {'label': 'whole grain pasta elbows', 'box': [0, 14, 327, 295]}, 20: {'label': 'whole grain pasta elbows', 'box': [33, 216, 136, 248]}, 21: {'label': 'Whole grain pasta elbows', 'box': [480, 332, 598, 378]}, 22: {'label': 'white beans', 'box': [184, 357, 302, 579]}, 23: {'label': 'Ichiban ramen noodles', 'box': [14, 311, 108, 381]}, 24: {'label': 'whole grain pasta elbows', 'box': [0, 29, 163, 289]}, 25: {'label': 'whole grain pasta elbows', 'box': [156, 115, 315, 283]}, 26: {'label': 'peanut butter', 'box': [322, 314, 489, 409]}, 27: {'label': 'chicken broth', 'box': [461, 31, 598, 222]}, 28: {'label': 'chicken broth', 'box': [45, 617, 192, 814]}}
+detection_store = DetectionStore()
+
+def pending_scan_status(content_name):
+    """Status of the image's scan job if it is still queued or running, else None."""
+    job = scan_jobs.get(content_name)
+    if job is not None and job["status"] in ("queued", "processing"):
+        return job["status"]
+    return None
 
-@app.get("/refresh-detections/{filename}")
+@app.post("/refresh-detections/{filename}")
 async def refresh_detections(filename: str):
-    global detection_data  # Reference the global variable
-    detection_data = {1: {'label': 'pasta sauce', 'box': [290, 379, 396, 590]}, 2: {'label': 'pasta sauce', 'box': [391, 387, 497, 591]}, 3: {'label': 'peanut butter', 'box': [192, 683, 283, 852]}, 4: {'label': 'ichiban ramen noodles', 'box': [456, 55, 557, 288]}, 5: {'label': 'dark chocolate peanut butter bar', 'box': [490, 382, 597, 601]}, 6: {'label': 'peanut butter', 'box': [193, 620, 289, 772]}, 7: {'label': 'chicken broth', 'box': [329, 0, 465, 242]}, 8: {'label': 'whole grain pasta elbows', 'box': [35, 216, 136, 248]}, 9: {'label': 'chicken broth', 'box': [11, 617, 600, 897]}, 10: {'label': 'white beans', 'box': [181, 352, 303, 581]}, 11: {'label': 'whole grain pasta elbows', 'box': [157, 21, 327, 290]}, 12: {'label': 'chicken broth', 'box': [285, 624, 348, 851]}, 13: {'label': 'whole grain pasta elbows', 'box': [0, 114, 165, 288]}, 14: {'label': 'dark chocolate peanut butter bar', 'box': [485, 382, 598, 602]}, 15: {'label': 'dark chocolate peanut butter bar', 'box': [343, 622, 408, 849]}, 16: {'label': 'whole grain pasta elbows', 'box': [0, 0, 599, 766]}, 17: {'label': 'white beans', 'box': [184, 357, 303, 579]}, 18: {'label': 'ichiban ramen noodles', 'box': [458, 33, 595, 286]}, 19: {'label': 'whole grain pasta elbows', 'box': [0, 14, 327, 295]}, 20: {'label': 'whole grain pasta elbows', 'box': [33, 216, 136, 248]}, 21: {'label': 'Whole grain pasta elbows', 'box': [480, 332, 598, 378]}, 22: {'label': 'white beans', 'box': [184, 357, 302, 579]}, 23: {'label': 'Ichiban ramen noodles', 'box': [14, 311, 108, 381]}, 24: {'label': 'whole grain pasta elbows', 'box': [0, 29, 163, 289]}, 25: {'label': 'whole grain pasta elbows', 'box': [156, 115, 315, 283]}, 26: {'label': 'peanut butter', 'box': [322, 314, 489, 409]}, 27: {'label': 'chicken broth', 'box': [461, 31, 598, 222]}, 28: {'label': 'chicken broth', 'box': [45, 617, 192, 814]}}
-    return detection_data
+    # Explicit reset: throw away edits and go back to the image's scan result
+    content_name = uploads.resolve(filename)
+    detections = load_result(content_name)
+    if detections is None:
+        status = pending_scan_status(content_name)
+        if status is not None:
+            raise HTTPException(status_code=409, detail=f"Scan is {status}")
+        raise HTTPException(status_code=404, detail="No scan result for this image")
+    version = detection_store.replace(content_name, detections)
+    return JSONResponse(content=detections, headers={"ETag": f'"{version}"'})
 
 
 @app.get("/get-detections/{filename}")
-async def get_detections(filename: str):
-    # Example format
-    
-    return detection_data
+async def get_detections(filename: str, request: Request):
+    content_name = uploads.resolve(filename)
+    # Editors poll this endpoint; answer unchanged sets with an empty 304 before reading any rows
+    etag = f'"{detection_store.version(content_name)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
 
-connected_clients = []
+    version, detections = detection_store.get(content_name)
+    if version == 0:
+        result = load_result(content_name)
+        if result is None:
+            # Nothing is stored until the scan has produced a result
+            status = pending_scan_status(content_name)
+            if status is None:
+                raise HTTPException(status_code=404, detail="No detections for this image")
+            return JSONResponse(status_code=202, content={}, headers={"X-Scan-Status": status})
+        detection_store.replace(content_name, result)
+        version, detections = detection_store.get(content_name)
+    return JSONResponse(content=detections, headers={"ETag": f'"{version}"'})
 
-active_connections = []
+broadcast_hub = BroadcastHub()
+summary_cache = SummaryCache()
 
 @app.websocket("/ws/emergency-updates")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    client = broadcast_hub.connect(websocket)
     try:
+        # Catch up on summaries that are still being streamed; later deltas continue from this offset
+        for emergency_id, text in summary_streams.items():
+            broadcast_hub.send(client, {
+                "type": "emergency_summary_delta",
+                "data": {"emergency_id": emergency_id, "offset": 0, "delta": text}
+            })
+
         # Send current emergencies immediately on connection
         try:
-            emergency_summaries = get_current_emergency_summaries()
+            emergency_summaries = await run_in_threadpool(get_current_emergency_summaries)
             if emergency_summaries:
-                await websocket.send_json({
+                broadcast_hub.send(client, {
                     "type": "emergency_update",
                     "data": emergency_summaries
                 })
@@ -299,9 +383,15 @@ async def websocket_endpoint(websocket: WebSocket):
         # Keep connection alive and handle incoming messages
         while True:
             data = await websocket.receive_text()
-            # Handle client messages if needed
+            broadcast_hub.received(client, data)
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
+    finally:
+        await broadcast_hub.disconnect(client)
+
+@app.get("/ws-metrics")
+async def websocket_metrics():
+    return broadcast_hub.metrics()
 
 class BoxData(BaseModel):
     label: str
@@ -310,22 +400,91 @@ class BoxData(BaseModel):
 @app.post("/add-detection/{filename}")
 async def add_detection(filename: str, request: Request):
     body = await request.json()
-    new_id = body["id"]
     data = body["data"]
-    detection_data[new_id] = {
-        "label": data["label"],
-        "box": data["box"]
-    }
-    return {"message": "Detection added", "id": new_id}
-
-@app.delete("/remove-detection/{id}")
-async def remove_detection(id: int):
-    print(detection_data)
-    if id in detection_data:
-        del detection_data[id]
-        return {"message": f"Detection with ID {id} removed"}
-    else:
+    version, new_id = detection_store.add(uploads.resolve(filename), data["label"], data["box"], det_id=body.get("id"))
+    return {"message": "Detection added", "id": new_id, "version": version}
+
+@app.delete("/remove-detection/{filename}/{id}")
+async def remove_detection(filename: str, id: int):
+    try:
+        version = detection_store.remove(uploads.resolve(filename), id)
+    except KeyError:
         raise HTTPException(status_code=404, detail="Detection not found")
+    return {"message": f"Detection with ID {id} removed", "version": version}
+
+class DetectionOperation(BaseModel):
+    op: str  # add, relabel, move or delete
+    id: Optional[int] = None
+    label: Optional[str] = None
+    box: Optional[List[int]] = None
+
+class DetectionBatch(BaseModel):
+    base_version: int
+    operations: List[DetectionOperation]
+
+@app.patch("/detections/{filename}")
+async def patch_detections(filename: str, batch: DetectionBatch):
+    """Apply a list of editor operations in one atomic step, rejecting edits made against an old version"""
+    try:
+        version, detections = detection_store.apply(
+            uploads.resolve(filename),
+            batch.base_version,
+            [operation.dict(exclude_none=True) for operation in batch.operations],
+        )
+    except StaleVersionError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "current_version": e.current_version})
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Detection {e.args[0]} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return JSONResponse(content={"version": version, "detections": detections}, headers={"ETag": f'"{version}"'})
+
+def spatial_response(filename, query):
+    version, detections, index = detection_store.spatial_index(uploads.resolve(filename))
+    hits = query(index)
+    return JSONResponse(content={"version": version, "detections": {det_id: detections[det_id] for det_id in hits}},
+                        headers={"ETag": f'"{version}"'})
+
+@app.get("/detections/{filename}/at")
+async def detections_at_point(filename: str, x: float, y: float):
+    """Hit-test: detections under a point, innermost (smallest) first"""
+    return spatial_response(filename, lambda index: index.query_point(x, y))
+
+@app.get("/detections/{filename}/within")
+async def detections_in_rect(filename: str, x_min: float, y_min: float, x_max: float, y_max: float):
+    """Detections overlapping a rectangle"""
+    return spatial_response(filename, lambda index: index.query_rect([x_min, y_min, x_max, y_max]))
+
+@app.get("/detections/{filename}/{id}/neighbours")
+async def detection_neighbours(filename: str, id: int, min_iou: float = 0.0):
+    """Other detections overlapping one detection with IoU above min_iou (likely duplicates at high values)"""
+    version, detections, index = detection_store.spatial_index(uploads.resolve(filename))
+    if id not in detections:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    neighbours = [{"id": det_id, "iou": iou, **detections[det_id]}
+                  for det_id, iou in index.neighbours(detections[id]["box"], min_iou) if det_id != id]
+    return JSONResponse(content={"version": version, "neighbours": neighbours}, headers={"ETag": f'"{version}"'})
+
+@app.get("/pantry-summary/{filename}")
+async def pantry_summary(filename: str):
+    """Item counts of a pantry image, with labels normalized (case, plurals, synonyms)"""
+    content_name = uploads.resolve(filename)
+    return {"filename": filename, "version": detection_store.version(content_name), "items": detection_store.label_counts(content_name)}
+
+@app.post("/render-detections/{filename}")
+async def rerender_detections(filename: str):
+    """Redraw the processed image from the original and the current (possibly edited) detections"""
+    content_name = uploads.resolve(filename)
+    original_path = IMG_TO_PREDICT_DIR / content_name
+    if not os.path.exists(original_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if is_video(content_name):
+        raise HTTPException(status_code=400, detail="Video scans are rendered as a contact sheet and cannot be redrawn")
+
+    version, detections = detection_store.get(content_name)
+    # Decoding, drawing and encoding the full image is CPU-bound; keep it off the event loop
+    await run_in_threadpool(render_detections, str(original_path), detections, output_path=str(RESULT_DIR / content_name))
+    return {"filename": filename, "status": "processed", "detections": len(detections), "version": version}
 
 @app.post("/push-emergency-request")
 async def handle_emergency_request(request: EmergencyRequest, background_tasks: BackgroundTasks):
@@ -333,11 +492,6 @@ async def handle_emergency_request(request: EmergencyRequest, background_tasks:
         print(f"EMERGENCY: {request.emergencyType} from {request.residentName} (ID: {request.residentId})")
         print(f"Timestamp: {request.timestamp}")
         
-        # Update the resident's emergency_requested status to true
-        resident_update = supabase.table("residents").update({
-            "emergency_requested": True,
-        }).eq("id", request.residentId).execute()
-        
         # Log the emergency in a separate emergency_logs table for history
         log_entry = {
             "resident_id": request.residentId,
@@ -348,7 +502,11 @@ async def handle_emergency_request(request: EmergencyRequest, background_tasks:
             "status": "PENDING"  
         }
         
-        log_result = supabase.table("emergency_logs").insert(log_entry).execute()
+        # Update the resident's emergency_requested status to true and log the emergency, concurrently
+        resident_update, log_result = await asyncio.gather(
+            residents.update(request.residentId, {"emergency_requested": True}),
+            emergency_logs.insert(log_entry),
+        )
         
         # Check if the resident update was successful
         if hasattr(resident_update, 'error') and resident_update.error:
@@ -393,7 +551,7 @@ async def request_non_emergency_care(request: NonEmergencyRequest):
             "status": "PENDING"
         }
         
-        care_result = supabase.table("non_emergency_logs").insert(care_request).execute()
+        care_result = await non_emergency_logs.insert(care_request)
         
         return {
             "success": True,
@@ -413,105 +571,124 @@ async def request_non_emergency_care(request: NonEmergencyRequest):
             "timestamp": datetime.now().isoformat()
         }
 
+# Text already broadcast per emergency id, for clients that connect mid-stream
+summary_streams = {}
+# Chunks received since the last flush: emergency id -> (offset of the first chunk, chunks)
+pending_deltas = {}
+# LLM chunks are coalesced into one message per interval, so a fast stream does
+# not fill client queues and get caretakers evicted as slow consumers
+SUMMARY_DELTA_INTERVAL = float(os.getenv("SUMMARY_DELTA_INTERVAL", "0.15"))
+
+def publish_summary_delta(emergency_id, offset, text):
+    """Buffer one streamed chunk and schedule a flush; runs on the event loop."""
+    if emergency_id not in pending_deltas:
+        pending_deltas[emergency_id] = (offset, [])
+        asyncio.get_running_loop().call_later(SUMMARY_DELTA_INTERVAL, flush_summary_delta, emergency_id)
+    pending_deltas[emergency_id][1].append(text)
+
+def flush_summary_delta(emergency_id):
+    """Broadcast the buffered chunks of one emergency as a single delta."""
+    pending = pending_deltas.pop(emergency_id, None)
+    if pending is None:
+        return
+    offset, chunks = pending
+    text = "".join(chunks)
+    summary_streams[emergency_id] = summary_streams.get(emergency_id, "") + text
+    broadcast_hub.broadcast({
+        "type": "emergency_summary_delta",
+        "data": {"emergency_id": emergency_id, "offset": offset, "delta": text}
+    })
+
+async def stream_emergency_summaries():
+    """Compute the summaries once, streaming new ones to every client, then send the final emergency_update."""
+    loop = asyncio.get_running_loop()
+    streamed = set()
+
+    def on_delta(emergency_id, offset, text):
+        streamed.add(emergency_id)
+        loop.call_soon_threadsafe(publish_summary_delta, emergency_id, offset, text)
+
+    try:
+        emergency_summaries = await run_in_threadpool(get_current_emergency_summaries, on_delta)
+    finally:
+        # Let any chunks still queued on the loop run, send what is buffered, then drop the partial text
+        await asyncio.sleep(0)
+        for emergency_id in streamed:
+            flush_summary_delta(emergency_id)
+            summary_streams.pop(emergency_id, None)
+    broadcast_hub.broadcast({
+        "type": "emergency_update",
+        "data": emergency_summaries
+    })
+
 async def notify_all_clients(resident_id, resident_name):
     # First notify of new emergency
-    for connection in active_connections:
-        try:
-            await connection.send_json({
-                "type": "new_emergency",
-                "data": {
-                    "resident_id": resident_id,
-                    "resident_name": resident_name,
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
-        except Exception as e:
-            print(f"Error notifying client of new emergency: {e}")
+    broadcast_hub.broadcast({
+        "type": "new_emergency",
+        "data": {
+            "resident_id": resident_id,
+            "resident_name": resident_name,
+            "timestamp": datetime.now().isoformat()
+        }
+    })
     
-    # Process the emergency summary (might take time with LLM)
+    # Process the emergency summary once (might take time with LLM), streaming it to everyone
     try:
-        emergency_summaries = get_current_emergency_summaries()
-        
-        # Then send the full summary
-        for connection in active_connections:
-            try:
-                await connection.send_json({
-                    "type": "emergency_update",
-                    "data": emergency_summaries
-                })
-            except Exception as e:
-                print(f"Error sending emergency summary: {e}")
+        await stream_emergency_summaries()
     except Exception as e:
         print(f"Error processing emergency summary: {e}")
 
-def get_current_emergency_summaries():
+def format_time_since(timestamp):
+    minutes = math.floor((datetime.now(timezone.utc) - datetime.fromisoformat(timestamp)).total_seconds() / 60)
+    if minutes < 1:
+        return "just now"
+    return f"{minutes} minute{'' if minutes == 1 else 's'} ago"
+
+def with_time_since_request(summary, timestamp):
+    """Add the request age to a (cached) JSON summary at send time, so it never goes stale."""
+    try:
+        data = text_to_dict(summary)
+        data["time_since_request"] = format_time_since(timestamp)
+    except (ValueError, TypeError) as e:
+        print(f"Could not add time_since_request to summary: {e}")
+        return summary
+    return json.dumps(data)
+
+def get_current_emergency_summaries(on_delta=None):
     """
     Get current emergency summaries for WebSocket updates with RAG
     Returns only the most recent emergency with a concise summary
+
+    on_delta(emergency_id, offset, text), if given, is called from this thread
+    with each chunk of a freshly generated summary as the LLM streams it.
     """
     try:
         # Fetch most recent emergency log with PENDING status
-        emergency_result = (supabase.table("emergency_logs")
-                          .select("*")
-                          .eq("status", "PENDING")
-                          .order("timestamp", desc=True)
-                          .limit(1)  # Only get the most recent one
-                          .execute())
+        emergency_result = emergency_logs.latest_pending_sync()
         
         if not emergency_result.data or len(emergency_result.data) == 0:
             return []
             
-        # Initialize RAG components for vector search
+        # Shared RAG components, built once at startup
         try:
-            from pinecone import Pinecone as PineconeClient
-            
-            # Initialize embeddings
-            embeddings = OllamaEmbeddings(model="nomic-embed-text")
-            
-            # Initialize Pinecone client
-            pc = PineconeClient(api_key=PINECONE_API_KEY)
-            index_name = "hackdavis-rag-index"
-            
-            # Get the one emergency we're processing
-            emergency_data = emergency_result.data[0]
-            resident_id = emergency_data.get("resident_id")
-            
-            # Use the new PineconeVectorStore class with the resident filter
-            docsearch = PineconeVectorStore(
-                index_name=index_name,
-                embedding=embeddings,
-                text_key="text",
-                pinecone_api_key=PINECONE_API_KEY
-            )
-            
-            # Create a filter for the similarity search later
-            filter_dict = {"resident_id": resident_id} if resident_id else None
-            print(f"Successfully initialized Pinecone vector store for resident {resident_id}")
-            
-            # Initialize LLM for RAG
-            llm = ChatCerebras(api_key=CEREBRAS_API_KEY, model="llama-3.3-70b")
-            chain = load_qa_chain(llm, chain_type="stuff")
-            
+            docsearch = clients.vector_store
+            llm = clients.llm
         except Exception as e:
             print(f"Error initializing RAG components for WebSocket: {e}")
             docsearch = None
-            chain = None
-            
+            llm = None
+
         # Process the emergency
         emergency_summaries = []
         emergency_data = emergency_result.data[0]
         resident_id = emergency_data.get("resident_id")
+        filter_dict = {"resident_id": resident_id} if resident_id else None
         resident_name = emergency_data.get("resident_name")
         time = emergency_data.get("timestamp")
         description = emergency_data.get("emergency_description")
-        now = datetime.now(timezone.utc)
-        time_dt = datetime.fromisoformat(time)  # still returns aware because of `Z` in string
-        diff = now - time_dt
-        diff_ms = diff.total_seconds() * 1000
-        diff_mins = math.floor(diff_ms / 60000)
         # Get resident details
         try:
-            resident_details = supabase.table("residents").select("*").eq("id", resident_id).execute()
+            resident_details = residents.find_by_id_sync(resident_id)
             if resident_details.data and len(resident_details.data) > 0:
                 resident_record = resident_details.data[0]
             else:
@@ -534,7 +711,7 @@ def get_current_emergency_summaries():
       #  em_type = emergency_data["type"] 
     
         # If RAG components are available, use them
-        if docsearch and chain:
+        if docsearch and llm:
             
             # Create a more concise prompt
             prompt = '''
@@ -545,8 +722,7 @@ Just give the bullet points, ensure the summary is clear, concise, and focused o
             
             Format in this way:
             
-            {"time_since_request": "15 minutes ago",
-            "location": "Room 19",
+            {"location": "Room 19",
             "description": "Resident Jerold is feeling like ",
             "steps_to_consider": [
                 "Medical history may suggest",
@@ -560,11 +736,10 @@ Just give the bullet points, ensure the summary is clear, concise, and focused o
             Medical conditions: {resident_info['medical_conditions']}
             Medications: {resident_info['medications']}
             Room: {resident_info['id']}
-            Request sent at: {diff_mins}
             Description: {description}
             '''
-            
-            try:
+
+            def summarize():
                 # Perform vector search with more targeted k value and apply filter
                 docs = docsearch.similarity_search(
                     prompt, 
@@ -573,9 +748,22 @@ Just give the bullet points, ensure the summary is clear, concise, and focused o
                 )
                 print(f"Found {len(docs)} relevant documents via similarity search")
                 
-                # Generate RAG response with instruction to be concise
-                response = chain.run(input_documents=docs, question=prompt)
-                summary = response
+                # Stream the RAG response so caretakers can start reading before it is complete
+                parts, offset = [], 0
+                for chunk in llm.stream(stuff_prompt(docs, prompt)):
+                    if not chunk.content:
+                        continue
+                    if on_delta is not None:
+                        on_delta(emergency_data.get("id"), offset, chunk.content)
+                    parts.append(chunk.content)
+                    offset += len(chunk.content)
+                return "".join(parts)
+
+            try:
+                # The prompt has no time-dependent fields, so the same emergency,
+                # resident record and documents always give a reusable summary
+                cache_key = summary_cache.key(emergency_data.get("id"), resident_id, resident_record)
+                summary = with_time_since_request(summary_cache.get_or_compute(cache_key, summarize), time)
             except Exception as search_error:
                 print(f"Vector search error: {search_error}")
                 summary = f"ALERT: {emergency_data.get('emergency_type', 'Unknown')} for {resident_name}"
@@ -602,7 +790,7 @@ Just give the bullet points, ensure the summary is clear, concise, and focused o
 @app.get("/get-emergency-requests")
 async def get_emergency_requests():
     try:
-        result = supabase.table("emergency_logs").select("*").order("timestamp", desc=True).execute()
+        result = await emergency_logs.list()
         
         print(f"Retrieved {len(result.data) if result.data else 0} emergency requests")
         
@@ -630,7 +818,7 @@ async def get_emergency_summary():
     """
     try:
         # Get the emergency summaries using the same function used by WebSockets 
-        emergency_summaries = get_current_emergency_summaries()
+        emergency_summaries = await run_in_threadpool(get_current_emergency_summaries)
         
         if not emergency_summaries:
             raise HTTPException(status_code=404, detail="No pending emergency requests found")
@@ -658,17 +846,13 @@ async def upload_medical_history_pdf(
         extension = original_filename.split('.')[-1] if '.' in original_filename else 'pdf'
         filename = f"uploaded_{unique_id}.{extension}"
 
-        # Upload to Supabase storage
+        # Upload to Supabase storage and get its public URL
         file_path = f"{filename}"
-        storage_response = supabase.storage.from_("medicalhistorypdfs").upload(
-            file_path,
-            contents,
-            file_options={"content-type": "application/pdf"}
-        )
-
-        # Get public URL
-        pdf_url = supabase.storage.from_("medicalhistorypdfs").get_public_url(file_path)
+        pdf_url = await medical_histories.upload_pdf(file_path, contents)
         
+        # Convert to integer explicitly
+        resident_id_int = int(resident_id) if resident_id else None
+
         # Process the PDF for RAG
         # First save the PDF to a temporary file
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
@@ -676,8 +860,8 @@ async def upload_medical_history_pdf(
             temp_pdf_path = temp_pdf.name
         
         try:
-            # Process with RAG
-            docs = load_and_split_pdf(temp_pdf_path)
+            # Process with RAG (parsing and embedding are slow, keep them off the event loop)
+            docs = await run_in_threadpool(load_and_split_pdf, temp_pdf_path)
             
             # Add resident_id to the metadata of each document
             if resident_id_int:
@@ -686,10 +870,9 @@ async def upload_medical_history_pdf(
                         doc.metadata = {}
                     doc.metadata['resident_id'] = resident_id_int
             
-            embeddings = OllamaEmbeddings(model="nomic-embed-text")
-            index_name = "hackdavis-rag-index"
-            init_pinecone_index(index_name)
-            vector_store = upload_vectors(docs, embeddings, index_name)
+            vector_store = await run_in_threadpool(upload_vectors, docs, index_name=INDEX_NAME)
+            if resident_id_int:
+                summary_cache.bump_documents(resident_id_int)
             print(f"PDF successfully processed and indexed for RAG with resident_id {resident_id_int} in metadata")
         except Exception as rag_err:
             print(f"Warning: RAG processing failed: {rag_err}")
@@ -699,9 +882,6 @@ async def upload_medical_history_pdf(
             if os.path.exists(temp_pdf_path):
                 os.unlink(temp_pdf_path)
 
-        # Convert to integer explicitly
-        resident_id_int = int(resident_id) if resident_id else None
-        # print("resident_id_int:", resident_id_int)
         # Insert into medical_histories table
         if resident_id_int:
             print(f"Attempting to insert with resident_id: {resident_id_int}, type: {type(resident_id_int)}")
@@ -710,7 +890,7 @@ async def upload_medical_history_pdf(
                 "pdf_url": pdf_url,
                 "created_at": datetime.now().isoformat()
             }
-            result = supabase.table("medical_histories").insert(medical_history_entry).execute()
+            result = await medical_histories.insert(medical_history_entry)
             if hasattr(result, 'error') and result.error:
                 raise Exception(f"Failed to insert medical history record: {result.error}")
             history_id = result.data[0]['id'] if result.data else None
@@ -742,7 +922,7 @@ async def upload_medical_history_pdf(
 async def get_resident_info(resident_name: str):
     try:
         # Query the resident information from Supabase using the name
-        result = supabase.table("residents").select("*").eq("name", resident_name).execute()
+        result = await residents.find_by_name(resident_name)
         
         if not result.data or len(result.data) == 0:
             return {"success": False, "message": f"Resident with name {resident_name} not found"}
@@ -770,18 +950,17 @@ async def get_resident_info(resident_name: str):
 async def get_residents_info():
     try:
         # Query all residents from the residents table
-        result = supabase.table("residents").select(
+        result = await residents.list(
             "name",
             "age",
             "medical_conditions",
             "medications", 
             "food_allergies",
             "special_supportive_services"
-        ).execute()
+        )
         
         # Return the data from the query
-        residents = result.data
-        return {"success": True, "residents": residents}
+        return {"success": True, "residents": result.data}
     
     except Exception as e:
         # Handle any errors that occur during the query
@@ -796,16 +975,17 @@ async def update_resident_profile(resident_data: dict):
             return {"success": False, "message": "Missing resident ID"}
             
         # Update the resident profile in Supabase
-        response = supabase.table("residents").update({
+        response = await residents.update(resident_id, {
             "name": resident_data.get("name"),
             "age": resident_data.get("age"),
             "medical_conditions": resident_data.get("medicalConditions"),
             "medications": resident_data.get("medications"),
             "food_allergies": resident_data.get("foodAllergies"),
             "special_supportive_services": resident_data.get("specialSupportiveServices")
-        }).eq("id", resident_id).execute()
+        })
         
         if response.data:
+            summary_cache.invalidate_resident(resident_id)
             return {"success": True, "message": "Profile updated successfully"}
         else:
             return {"success": False, "message": "Failed to update profile"}
@@ -816,7 +996,7 @@ async def update_resident_profile(resident_data: dict):
 @app.get("/get_emergency_requests")
 async def get_emergency_requests():
     try:
-        result = supabase.table("emergency_logs").select("*").order("timestamp", desc=True).execute()
+        result = await emergency_logs.list()
         
         print(f"Retrieved {len(result.data) if result.data else 0} emergency requests")
         
@@ -836,15 +1016,13 @@ async def get_emergency_requests():
             detail="Failed to fetch emergency requests"
         )
     
-def get_all_labels(d):
-    labels = [item["label"] for item in d.values()]
-    return ",".join(labels)
-
 @app.get("/get-recipes-by-name/{resident_name}")
-async def get_recipes_by_name(resident_name: str):
+async def get_recipes_by_name(resident_name: str, filename: Optional[str] = None):
     try:
         data = await get_resident_info(resident_name) 
-        unique_foods = get_all_labels(detection_data)
+        # Without a filename, cook from the pantry image that was edited most recently
+        image = uploads.resolve(filename) if filename else detection_store.latest_image()
+        ingredients = detection_store.label_counts(image) if image else {}
 
         resident_info = ResidentInfo(
             name=resident_name,
@@ -855,7 +1033,8 @@ async def get_recipes_by_name(resident_name: str):
             foodAllergies=data.get("food_allergies"),
             specialSupportiveServices=data.get("special_supportive_services"),
         )
-        d = get_dict(resident_info, unique_foods)
+        # Synchronous Cerebras call: run it in a thread so the event loop keeps serving
+        d = await asyncio.wait_for(run_in_threadpool(get_dict, resident_info, ingredients), RECIPE_TIMEOUT)
         return d
 
     except Exception as e:
@@ -870,7 +1049,7 @@ async def update_emergency_status(emergency_name: str, background_tasks: Backgro
         print(f"Attempting to resolve emergency for resident: {emergency_name}")
         
         # First, check if any matching records exist
-        check_result = supabase.table("emergency_logs").select("*").eq("resident_name", emergency_name).execute()
+        check_result = await emergency_logs.find_by_resident_name(emergency_name)
         
         if not check_result.data or len(check_result.data) == 0:
             print(f"No emergency records found for resident: {emergency_name}")
@@ -882,10 +1061,7 @@ async def update_emergency_status(emergency_name: str, background_tasks: Backgro
             print(f"Record ID: {record.get('id')}, Status: {record.get('status')}")
         
         # Update only the PENDING ones
-        result = supabase.table("emergency_logs").update({
-            "status": "RESOLVED",
-            "resolved_at": datetime.now().isoformat()
-        }).eq("resident_name", emergency_name).eq("status", "PENDING").execute()
+        result = await emergency_logs.resolve_pending(emergency_name, datetime.now().isoformat())
         
         if not result.data or len(result.data) == 0:
             print(f"No PENDING emergency records found for resident: {emergency_name}")
@@ -893,6 +1069,8 @@ async def update_emergency_status(emergency_name: str, background_tasks: Backgro
         
         # Get the updated emergency for the websocket notification
         emergency_data = result.data[0]
+        for record in result.data:
+            summary_cache.invalidate_emergency(record["id"])
         
         # Notify all connected clients about the status change
         background_tasks.add_task(notify_status_update, emergency_data)
@@ -913,25 +1091,20 @@ async def update_emergency_status(emergency_name: str, background_tasks: Backgro
 
 async def notify_status_update(emergency_data):
     """Notify all connected WebSocket clients about a status update"""
-    for connection in active_connections:
-        try:
-            await connection.send_json({
-                "type": "status_update",
-                "data": {
-                    "emergency_id": emergency_data["id"],
-                    "status": "RESOLVED",
-                    "updated_at": datetime.now().isoformat()
-                }
-            })
-            
-            # Also send updated emergency summaries
-            emergency_summaries = get_current_emergency_summaries()
-            await connection.send_json({
-                "type": "emergency_update",
-                "data": emergency_summaries
-            })
-        except Exception as e:
-            print(f"Error notifying client of status update: {e}")
+    broadcast_hub.broadcast({
+        "type": "status_update",
+        "data": {
+            "emergency_id": emergency_data["id"],
+            "status": "RESOLVED",
+            "updated_at": datetime.now().isoformat()
+        }
+    })
+
+    # Also send updated emergency summaries, computed once for everyone
+    try:
+        await stream_emergency_summaries()
+    except Exception as e:
+        print(f"Error notifying clients of status update: {e}")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,242 @@
+import math
+import os
+
+# Post-detection filtering. YOLO runs at a very low confidence threshold, so
+# the raw box list contains near-duplicates and whole-frame boxes that would
+# each cost a classification call.
+BOX_IOU_THRESHOLD = float(os.getenv("BOX_IOU_THRESHOLD", "0.6"))
+BOX_MAX_FRAME_COVERAGE = float(os.getenv("BOX_MAX_FRAME_COVERAGE", "0.8"))
+BOX_MIN_AREA = float(os.getenv("BOX_MIN_AREA", "400"))
+BOX_TOP_K = int(os.getenv("BOX_TOP_K", "40"))
+# Side of a GridIndex cell in pixels; roughly the size of a typical pantry item box
+GRID_CELL_SIZE = float(os.getenv("GRID_CELL_SIZE", "128"))
+# Boxes touching more cells than this are not registered cell by cell
+GRID_MAX_BOX_CELLS = int(os.getenv("GRID_MAX_BOX_CELLS", "1024"))
+
+
+def box_area(box):
+    x_min, y_min, x_max, y_max = box
+    return max(0.0, x_max - x_min) * max(0.0, y_max - y_min)
+
+
+def intersection_area(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    return width * height
+
+
+def box_iou(a, b):
+    inter = intersection_area(a, b)
+    if inter == 0:
+        return 0.0
+    return inter / (box_area(a) + box_area(b) - inter)
+
+
+class GridIndex:
+    """Uniform-grid spatial index over boxes, keyed by any hashable id.
+
+    Each box is registered in every cell it touches, so point and rectangle
+    queries only look at the few boxes near the query instead of the whole set.
+    Boxes spanning more than max_box_cells cells are kept in a side list that
+    every query checks, and a query spanning more cells than there are boxes
+    scans the boxes directly, so neither ever walks an unbounded grid.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE, max_box_cells=GRID_MAX_BOX_CELLS):
+        self.cell_size = cell_size
+        self.max_box_cells = max_box_cells
+        self.boxes = {}
+        self.cells = {}
+        self.large = set()
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _span(self, box):
+        """Number of cells box touches, or None if a coordinate is not finite."""
+        if not all(math.isfinite(v) for v in box):
+            return None
+        x_min, y_min, x_max, y_max = (v // self.cell_size for v in box)
+        return max(0, x_max - x_min + 1) * max(0, y_max - y_min + 1)
+
+    def _cells(self, box):
+        x_min, y_min, x_max, y_max = (int(v // self.cell_size) for v in box)
+        for cx in range(x_min, x_max + 1):
+            for cy in range(y_min, y_max + 1):
+                yield cx, cy
+
+    def insert(self, key, box):
+        if key in self.boxes:
+            self.remove(key)
+        box = [float(v) for v in box]
+        self.boxes[key] = box
+        span = self._span(box)
+        if span is None or span > self.max_box_cells:
+            self.large.add(key)
+            return
+        for cell in self._cells(box):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        box = self.boxes.pop(key)
+        if key in self.large:
+            self.large.discard(key)
+            return
+        for cell in self._cells(box):
+            members = self.cells[cell]
+            members.discard(key)
+            if not members:
+                del self.cells[cell]
+
+    def _candidates(self, box):
+        span = self._span(box)
+        if span is None or span > len(self.boxes):
+            return set(self.boxes)
+        found = set(self.large)
+        for cell in self._cells(box):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def query_point(self, x, y):
+        """Ids of the boxes containing (x, y), smallest first so the innermost box is the hit."""
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return []
+        candidates = self.large | self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), set())
+        hits = [key for key in candidates
+                if self.boxes[key][0] <= x <= self.boxes[key][2] and self.boxes[key][1] <= y <= self.boxes[key][3]]
+        return sorted(hits, key=lambda key: box_area(self.boxes[key]))
+
+    def query_rect(self, box):
+        """Ids of the boxes overlapping box (touching edges do not count)."""
+        return sorted(key for key in self._candidates(box) if intersection_area(box, self.boxes[key]) > 0)
+
+    def neighbours(self, box, min_iou=0.0):
+        """(id, iou) of the boxes overlapping box with IoU above min_iou, highest IoU first."""
+        pairs = [(key, box_iou(box, self.boxes[key])) for key in self.query_rect(box)]
+        return sorted([(key, iou) for key, iou in pairs if iou > min_iou], key=lambda pair: -pair[1])
+
+
+def filter_boxes(boxes, scores=None, image_size=None, iou_threshold=BOX_IOU_THRESHOLD,
+                 max_frame_coverage=BOX_MAX_FRAME_COVERAGE, min_area=BOX_MIN_AREA, top_k=BOX_TOP_K):
+    """Return the indices of the boxes worth classifying, in their original order.
+
+    Boxes smaller than min_area or covering more than max_frame_coverage of
+    image_size (width, height) are dropped, then greedy IoU suppression keeps
+    the highest scoring box of every overlapping group, and finally only the
+    top_k best scoring boxes survive. Pass None or 0 to disable a step.
+    """
+    boxes = [[float(v) for v in box] for box in boxes]
+    if scores is None:
+        scores = [1.0] * len(boxes)
+    frame_area = image_size[0] * image_size[1] if image_size else None
+
+    candidates = []
+    for idx, box in enumerate(boxes):
+        area = box_area(box)
+        if min_area and area < min_area:
+            continue
+        if frame_area and max_frame_coverage and area / frame_area > max_frame_coverage:
+            continue
+        candidates.append(idx)
+
+    # Highest score first; ties keep detection order so results are stable
+    candidates.sort(key=lambda idx: -float(scores[idx]))
+    kept = []
+    index = GridIndex()
+    for idx in candidates:
+        if iou_threshold and index.neighbours(boxes[idx], iou_threshold):
+            continue
+        kept.append(idx)
+        index.insert(idx, boxes[idx])
+        if top_k and len(kept) >= top_k:
+            break
+
+    return sorted(kept)
+
+
+def intersection_over_smaller(a, b):
+    inter = intersection_area(a, b)
+    if inter == 0:
+        return 0.0
+    return inter / max(1e-9, min(box_area(a), box_area(b)))
+
+
+def cut_by_tile(box, tile, image_size, margin=2.0):
+    """Whether box touches an edge of its tile that lies inside the image, i.e. the object may continue in a neighbour."""
+    width, height = image_size
+    return ((tile[0] > 0 and box[0] - tile[0] <= margin) or (tile[1] > 0 and box[1] - tile[1] <= margin)
+            or (tile[2] < width and tile[2] - box[2] <= margin) or (tile[3] < height and tile[3] - box[3] <= margin))
+
+
+def merge_tiled_boxes(boxes, scores, tiles=None, image_size=None, iou_threshold=BOX_IOU_THRESHOLD, ios_threshold=0.8,
+                      min_size_ratio=0.2, max_frame_coverage=BOX_MAX_FRAME_COVERAGE, min_area=BOX_MIN_AREA):
+    """Cross-tile suppression for boxes already mapped back to full-image coordinates.
+
+    Boxes that are too small or cover too much of image_size are dropped first,
+    then overlapping boxes are suppressed by IoU. An object cut by a tile edge
+    shows up as a partial box inside the full one, which IoU does not catch,
+    so a box that touches an inner edge of its tile (tiles[i] is the tile
+    rectangle box i was detected in) and is mostly contained in a box of
+    comparable size (intersection over the smaller area, and at least
+    min_size_ratio of its area) is merged into it as well. Items inside a
+    shelf-sized box are not cut by a tile edge and are kept. Returns kept
+    indices in score order.
+    """
+    frame_area = image_size[0] * image_size[1] if image_size else None
+    order = []
+    for idx in sorted(range(len(boxes)), key=lambda idx: -float(scores[idx])):
+        area = box_area(boxes[idx])
+        if min_area and area < min_area:
+            continue
+        if frame_area and max_frame_coverage and area / frame_area > max_frame_coverage:
+            continue
+        order.append(idx)
+    cut = {idx: tiles is not None and image_size is not None and cut_by_tile(boxes[idx], tiles[idx], image_size) for idx in order}
+
+    def partial_of(small, large):
+        small_area, large_area = box_area(boxes[small]), box_area(boxes[large])
+        return (cut[small] and small_area <= large_area and small_area >= min_size_ratio * large_area
+                and intersection_over_smaller(boxes[small], boxes[large]) > ios_threshold)
+
+    kept = []
+    index = GridIndex()
+    for idx in order:
+        box = boxes[idx]
+        overlapping = index.query_rect(box)
+        if any(box_iou(box, index.boxes[k]) > iou_threshold or partial_of(idx, k) for k in overlapping):
+            continue
+        # A higher scoring partial box gives way to the whole object
+        for k in overlapping:
+            if partial_of(k, idx):
+                kept.remove(k)
+                index.remove(k)
+        kept.append(idx)
+        index.insert(idx, box)
+    return kept
+
+
+def match_boxes(new_boxes, old_boxes, min_iou=0.5, accept=None):
+    """Greedy one-to-one matching of two box lists by IoU, best overlaps first.
+
+    accept(new_idx, old_idx), if given, can veto a candidate pair (e.g. when
+    the crops look different). Returns a dict of new index -> old index.
+    """
+    pairs = []
+    for i, new_box in enumerate(new_boxes):
+        for j, old_box in enumerate(old_boxes):
+            iou = box_iou(new_box, old_box)
+            if iou >= min_iou:
+                pairs.append((iou, i, j))
+    pairs.sort(reverse=True)
+
+    matches, used = {}, set()
+    for _, i, j in pairs:
+        if i in matches or j in used:
+            continue
+        if accept is not None and not accept(i, j):
+            continue
+        matches[i] = j
+        used.add(j)
+    return matches
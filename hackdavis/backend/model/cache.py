@@ -0,0 +1,145 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+cache_dir = os.path.join(os.path.dirname(curr_dir), "data", "cache")
+
+CLASSIFY_CACHE = os.getenv("CLASSIFY_CACHE", "1") == "1"
+CLASSIFY_CACHE_MEMORY_ENTRIES = int(os.getenv("CLASSIFY_CACHE_MEMORY_ENTRIES", "4096"))
+CLASSIFY_CACHE_PATH = os.getenv("CLASSIFY_CACHE_PATH", os.path.join(cache_dir, "classifications.sqlite3"))
+
+INVENTORY_CACHE = os.getenv("INVENTORY_CACHE", "1") == "1"
+INVENTORY_CACHE_PATH = os.getenv("INVENTORY_CACHE_PATH", os.path.join(cache_dir, "inventory.sqlite3"))
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", str(7 * 24 * 3600)))
+INVENTORY_CACHE_MAX_ENTRIES = int(os.getenv("INVENTORY_CACHE_MAX_ENTRIES", "2000"))
+
+
+def dhash(image_bytes, hash_size=8):
+    """Difference hash of an encoded image as a hex string.
+
+    Small changes in lighting, JPEG re-encoding or a slightly shifted box give
+    the same hash, so the same jar on the same shelf maps to the same key.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+class DiskCache:
+    """Small persistent key/value store backed by SQLite, safe to share between threads.
+
+    Entries older than ttl seconds are treated as missing, and once the store
+    holds more than max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL DEFAULT 0)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(cache)")]
+        if "accessed_at" not in columns:
+            self.conn.execute("ALTER TABLE cache ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            if self.max_entries:
+                self.conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                              (key, json.dumps(value), now, now))
+            if self.max_entries:
+                self.conn.execute("""DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed_at ASC
+                    LIMIT MAX(0, (SELECT COUNT(*) FROM cache) - ?))""", (self.max_entries,))
+            self.conn.commit()
+
+
+class ClassificationCache:
+    """Two-tier crop label cache: a bounded in-memory LRU in front of a DiskCache."""
+
+    def __init__(self, path=CLASSIFY_CACHE_PATH, max_entries=CLASSIFY_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = DiskCache(path) if path else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(crop, allowed_items):
+        """Key a crop by its perceptual hash plus the (order independent) set of allowed items."""
+        items = hashlib.sha1(",".join(sorted(set(allowed_items))).encode()).hexdigest()[:16]
+        return f"{dhash(crop)}:{items}"
+
+    def _remember(self, key, label):
+        self.memory[key] = label
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self.memory[key]
+        label = self.disk.get(key) if self.disk else None
+        with self.lock:
+            if label is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, label)
+        return label
+
+    def set(self, key, label):
+        with self.lock:
+            self._remember(key, label)
+        if self.disk:
+            self.disk.set(key, label)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def hash_distance(a, b):
+    """Hamming distance between two dhash hex strings."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The detector runs on CPU in production. The model is loaded on first use
+# (not at import), warmed up once, and shared by everything in the process.
+YOLO_WEIGHTS = os.getenv("YOLO_WEIGHTS", os.path.join(curr_dir, "yolo11n.pt"))
+# "torch" runs the .pt weights directly; "onnx" or "openvino" export them once and run the exported model
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "torch")
+# Intra-op threads for inference; 0 keeps the library default (all cores)
+YOLO_THREADS = int(os.getenv("YOLO_THREADS", "0"))
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+YOLO_CONF = float(os.getenv("YOLO_CONF", "0.01"))
+YOLO_WARMUP = os.getenv("YOLO_WARMUP", "1") == "1"
+
+EXPORT_SUFFIXES = {"onnx": ".onnx", "openvino": "_openvino_model"}
+
+
+class DetectionEngine:
+    def __init__(self, weights=YOLO_WEIGHTS, backend=YOLO_BACKEND, threads=YOLO_THREADS, imgsz=YOLO_IMGSZ, conf=YOLO_CONF):
+        if backend != "torch" and backend not in EXPORT_SUFFIXES:
+            raise ValueError(f"Unknown YOLO backend {backend!r}, expected torch, onnx or openvino")
+        self.weights = weights
+        self.backend = backend
+        self.threads = threads
+        self.imgsz = imgsz
+        self.conf = conf
+        self.model = None
+        # Ultralytics predictors are not safe to call from several threads at once
+        self.lock = threading.Lock()
+        self.counters = {"images": 0, "batches": 0, "image_seconds": 0.0, "last_batch_seconds": 0.0, "load_seconds": 0.0}
+
+    def _configure_threads(self):
+        if not self.threads:
+            return
+        os.environ["OMP_NUM_THREADS"] = str(self.threads)
+        import cv2
+        import torch
+        torch.set_num_threads(self.threads)
+        cv2.setNumThreads(self.threads)
+
+    def _model_path(self):
+        if self.backend == "torch":
+            return self.weights
+        exported = os.path.splitext(self.weights)[0] + EXPORT_SUFFIXES[self.backend]
+        if not os.path.exists(exported):
+            from ultralytics import YOLO
+            print(f"Exporting {self.weights} to {self.backend}")
+            exported = YOLO(self.weights).export(format=self.backend, imgsz=self.imgsz)
+        return exported
+
+    def load(self, warmup=YOLO_WARMUP):
+        with self.lock:
+            if self.model is not None:
+                return self.model
+            from ultralytics import YOLO
+            start = time.perf_counter()
+            self._configure_threads()
+            self.model = YOLO(self._model_path(), task="detect")
+            if warmup:
+                # The first call pays for graph setup and memory allocation; do it before real traffic
+                self.model.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, conf=self.conf, verbose=False)
+            self.counters["load_seconds"] = time.perf_counter() - start
+            print(f"Loaded {self.backend} detector in {self.counters['load_seconds']:.2f}s")
+            return self.model
+
+    def predict(self, sources):
+        """Detect boxes on a list of image paths or arrays in one batched call.
+
+        Returns one (xyxy boxes, confidences) pair of numpy arrays per source.
+        """
+        model = self.load()
+        with self.lock:
+            start = time.perf_counter()
+            results = model.predict(sources, imgsz=self.imgsz, conf=self.conf, verbose=False)
+            elapsed = time.perf_counter() - start
+            self.counters["images"] += len(sources)
+            self.counters["batches"] += 1
+            self.counters["image_seconds"] += elapsed
+            self.counters["last_batch_seconds"] = elapsed
+        print(f"Detected {len(sources)} image(s) in {elapsed * 1000:.0f}ms ({elapsed * 1000 / max(1, len(sources)):.0f}ms per image)")
+        return [(result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()) for result in results]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["backend"] = self.backend
+        stats["mean_image_ms"] = stats["image_seconds"] * 1000 / stats["images"] if stats["images"] else 0.0
+        return stats
+
+
+engine = None
+engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide detection engine, creating it on first use."""
+    global engine
+    with engine_lock:
+        if engine is None:
+            engine = DetectionEngine()
+        return engine
@@ -1,18 +1,30 @@
 from PIL import Image
-import base64
-from anthropic import Anthropic
+import io
+from anthropic import Anthropic, APIConnectionError, InternalServerError, RateLimitError
 import cv2
-from ultralytics import YOLO
+import numpy as np
 import hashlib
-import shutil
+import heapq
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from model.boxes import filter_boxes, match_boxes, merge_tiled_boxes
+from model.labels import normalize_label
+from model.cache import ClassificationCache, DiskCache, dhash, hash_distance, CLASSIFY_CACHE, INVENTORY_CACHE, INVENTORY_CACHE_PATH, INVENTORY_CACHE_TTL, INVENTORY_CACHE_MAX_ENTRIES
+from model.engine import get_engine
+from model.preprocess import encode_for_model, payload_stats
+from model.local_classifier import LocalClassifier, is_available as local_classifier_available
+from model.tracking import IoUTracker, iter_frames, TRACK_MIN_HITS
 curr_dir = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(curr_dir, '..', '..', '.env')
 load_dotenv(dotenv_path)
 
 client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-model = YOLO(os.path.join(curr_dir, "yolo11n.pt"))
 
 parent_dir = os.path.dirname(curr_dir)
 data_dir = os.path.join(parent_dir, "data")
@@ -20,35 +32,154 @@ image_dir = os.path.join(data_dir, "images")
 pred_folder = os.path.join(data_dir, "img_to_predict")
 result_folder = os.path.join(data_dir, "result")
 
-def make_prediction(folder_name, pred_path):
-    results = model.predict(pred_path, show=False, save=False, line_width=2, conf=0.01, save_crop=False,save_txt=False,show_labels=True,show_conf=False)
-    image = Image.open(pred_path)
-    im_path =  os.path.join(image_dir, folder_name)  # Directory to save the crops
-    os.makedirs(im_path, exist_ok=True)
-    # Loop through the detections and save each cropped image
-    for idx, bbox in enumerate(results[0].boxes.xyxy.cpu().numpy()):
+# Crop classification is I/O bound (one vision call per crop), so crops are
+# classified concurrently with a bounded number of requests in flight
+CLASSIFY_MAX_IN_FLIGHT = int(os.getenv("CLASSIFY_MAX_IN_FLIGHT", "8"))
+CLASSIFY_TIMEOUT = float(os.getenv("CLASSIFY_TIMEOUT", "30"))
+CLASSIFY_RETRIES = int(os.getenv("CLASSIFY_RETRIES", "3"))
+CLASSIFY_BACKOFF = float(os.getenv("CLASSIFY_BACKOFF", "1.0"))
+# "single" sends one request per crop, "batched" packs CLASSIFY_BATCH_SIZE crops per request
+CLASSIFY_MODE = os.getenv("CLASSIFY_MODE", "single")
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "10"))
+# Repeat scans of an unchanged pantry are answered from the perceptual-hash cache
+classification_cache = ClassificationCache() if CLASSIFY_CACHE else None
+inventory_cache = DiskCache(INVENTORY_CACHE_PATH, ttl=INVENTORY_CACHE_TTL, max_entries=INVENTORY_CACHE_MAX_ENTRIES) if INVENTORY_CACHE else None
+# Run the full-frame inventory call while YOLO is detecting instead of after it
+INVENTORY_CONCURRENT = os.getenv("INVENTORY_CONCURRENT", "1") == "1"
+# Incremental re-scans reuse a previous label when the box overlaps and the crop looks the same
+REUSE_MIN_IOU = float(os.getenv("REUSE_MIN_IOU", "0.5"))
+REUSE_MAX_HASH_DISTANCE = int(os.getenv("REUSE_MAX_HASH_DISTANCE", "10"))
+# Video scans: detect every VIDEO_STRIDE-th frame and build the inventory from the busiest frames
+VIDEO_STRIDE = int(os.getenv("VIDEO_STRIDE", "3"))
+VIDEO_KEYFRAMES = int(os.getenv("VIDEO_KEYFRAMES", "3"))
+# Contact sheet of a video scan: tile size in pixels and tiles per row
+SHEET_TILE = 192
+SHEET_COLUMNS = 6
+# Sliced detection for large photos: "auto" tiles images whose long side exceeds two tiles
+DETECT_TILED = os.getenv("DETECT_TILED", "auto")
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_BATCH = int(os.getenv("TILE_BATCH", "8"))
+# Optional local CLIP tier in front of the vision model; crops it is unsure about are escalated
+local_classifier = LocalClassifier() if local_classifier_available() else None
+# Crops stay in memory; set CROP_DEBUG=1 to also write them to data/images/<folder>
+CROP_DEBUG = os.getenv("CROP_DEBUG", "0") == "1"
+
+def detect_boxes(pred_path, tiled=DETECT_TILED):
+    """Run YOLO on one image and return (xyxy boxes, confidences) as numpy arrays.
+
+    tiled is "auto", "1" or "0" (or a bool); see detect_boxes_tiled.
+    """
+    if tiled in (True, "1"):
+        return detect_boxes_tiled(pred_path)
+    if tiled == "auto":
+        with Image.open(pred_path) as image:
+            if max(image.size) > 2 * TILE_SIZE:
+                return detect_boxes_tiled(pred_path)
+    return get_engine().predict([pred_path])[0]
+
+def tile_offsets(length, tile_size, overlap):
+    """Start offsets of overlapping tiles covering [0, length), the last one flush with the edge."""
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1 - overlap)))
+    offsets = list(range(0, length - tile_size, stride))
+    offsets.append(length - tile_size)
+    return offsets
+
+def detect_boxes_tiled(pred_path, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH, include_full=True):
+    """Sliced inference: detect on overlapping full-resolution tiles and merge the boxes.
+
+    Small items survive because each tile is seen at (close to) native
+    resolution instead of the whole photo being downsampled to one input.
+    Tiles are sent to the detector as batches, which spreads each batch over
+    all cores. A downsampled full-frame pass is included so items larger
+    than a tile are still found; cross-tile duplicates are suppressed.
+    """
+    img = cv2.imread(pred_path)
+    if img is None:
+        raise ValueError(f"Could not read image {pred_path}")
+    height, width = img.shape[:2]
+    origins = [(x, y) for y in tile_offsets(height, tile_size, overlap) for x in tile_offsets(width, tile_size, overlap)]
+    tiles = [img[y:y + tile_size, x:x + tile_size] for x, y in origins]
+    if include_full:
+        origins.append((0, 0))
+        tiles.append(img)
+
+    engine = get_engine()
+    all_boxes, all_scores, box_tiles = [], [], []
+    for i in range(0, len(tiles), batch_size):
+        batch = list(zip(origins[i:i + batch_size], tiles[i:i + batch_size]))
+        for ((x, y), tile), (boxes, scores) in zip(batch, engine.predict([tile for _, tile in batch])):
+            if len(boxes):
+                all_boxes.append(boxes + np.array([x, y, x, y], dtype=boxes.dtype))
+                all_scores.append(scores)
+                box_tiles.extend([(x, y, x + tile.shape[1], y + tile.shape[0])] * len(boxes))
+    if not all_boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros((0,), dtype=np.float32)
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    keep = merge_tiled_boxes(boxes.tolist(), scores.tolist(), box_tiles, (width, height))
+    print(f"Tiled detection: {len(tiles)} tiles, {len(boxes)} raw boxes, {len(keep)} after cross-tile suppression")
+    return boxes[keep], scores[keep]
+
+def detect_boxes_batch(pred_paths):
+    """Run YOLO on several images in one batched call, one (boxes, confidences) pair per image."""
+    return get_engine().predict(list(pred_paths))
+
+def crop_images(image, boxes):
+    """Crop every box out of a PIL image and return the crops as in-memory JPEG bytes, in box order."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    crops = []
+    for bbox in boxes:
         x_min, y_min, x_max, y_max = bbox
-        # Crop the image using the bounding box coordinates
-        cropped_image = image.crop((x_min, y_min, x_max, y_max))
-        # Save the cropped image with a predictable name (e.g., based on index)
-        cropped_image.save(os.path.join(im_path, f"cropped_{idx}.jpg"))
-        print(f"Saved crop {idx} at {im_path}")
-
-    return results[0].boxes.xyxy.cpu().numpy()
-
-  
-def get_all_image_files(directory):
-    image_files = []
-    for filename in os.listdir(directory):
-        image_files.append(os.path.join(directory, filename))
-    
-    # Sort by the numeric part after the underscore
-    image_files.sort(key=lambda x: int(os.path.splitext(os.path.basename(x))[0].split("_")[1]))
-    return image_files
+        buffer = io.BytesIO()
+        image.crop((x_min, y_min, x_max, y_max)).save(buffer, format="JPEG")
+        crops.append(buffer.getvalue())
+    return crops
 
-def get_pantry_items_from_full_image(image_path):
-    with open(image_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode("utf-8")
+def save_crops(crops, folder_name):
+    """Debug sink: write crops to data/images/<folder_name>/cropped_{idx}.jpg."""
+    im_path = os.path.join(image_dir, folder_name)
+    os.makedirs(im_path, exist_ok=True)
+    for idx, crop in enumerate(crops):
+        with open(os.path.join(im_path, f"cropped_{idx}.jpg"), "wb") as f:
+            f.write(crop)
+    print(f"Saved {len(crops)} crops at {im_path}")
+
+def read_image_bytes(image):
+    """Accept either a file path or already encoded image bytes."""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    with open(image, "rb") as f:
+        return f.read()
+
+def image_block(image, preset):
+    """Build a base64 image content block, resized and re-encoded with the given preprocess preset."""
+    image_data, media_type = encode_for_model(read_image_bytes(image), preset)
+    return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": image_data}}
+
+INVENTORY_PROMPTS = {
+    "unique": "List all the food or pantry items visible in this image as one-word lowercase nouns, separated by commas. Be as specific as possible. Only include full/recognizable items.",
+    "all": "Scan each food or pantry item in this image and list only FOODS as lower-case nouns separated by commas and repeat items if you see more than one. Be as specific as possible. Only include full/recognizable items.",
+}
+
+def get_inventory(image, variant="all"):
+    """List the pantry items in a full image, cached by the SHA-256 of the image bytes.
+
+    variant "unique" lists each item once, "all" repeats items that appear
+    several times. Answers are kept in a persistent TTL/size bounded cache,
+    so re-scanning the same photo skips the full-frame vision call.
+    """
+    data = read_image_bytes(image)
+    key = f"{variant}:{hashlib.sha256(data).hexdigest()}"
+    if inventory_cache is not None:
+        cached = inventory_cache.get(key)
+        if cached is not None:
+            print("Inventory cache hit")
+            return cached
 
     response = client.messages.create(
         model="claude-3-7-sonnet-20250219",  
@@ -56,26 +187,34 @@ def get_pantry_items_from_full_image(image_path):
         messages=[{
             "role": "user",
             "content": [
-                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": image_data}},
-                {"type": "text", "text": "List all the food or pantry items visible in this image as one-word lowercase nouns, separated by commas. Be as specific as possible. Only include full/recognizable items."}
+                image_block(data, "inventory"),
+                {"type": "text", "text": INVENTORY_PROMPTS[variant]}
             ]
         }]
     )
     # Example response: "lettuce, tomato, milk, cheese"
-    return response.content[0].text.strip()
+    items = response.content[0].text.strip()
+    if inventory_cache is not None:
+        inventory_cache.set(key, items)
+    return items
 
-def classify_image_with_claude(image_path, allowed_items):
-    prompt = f"From this image, identify which one of the following items it is (if any): {allowed_items}. Only respond with one of the items from the list, or NULL if unsure or not in the list. If two items in the image, only respond with one item. Do not give me any response other than NULL or the name of the item."
-    with open(image_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode("utf-8")
+def get_pantry_items_from_full_image(image_path):
+    return get_inventory(image_path, "unique")
 
-    response = client.messages.create(
+def get_all_pantry_items_from_full_image(image_path):
+    return get_inventory(image_path, "all")
+
+def classify_image_with_claude(image, allowed_items, timeout=None):
+    prompt = f"From this image, identify which one of the following items it is (if any): {allowed_items}. Only respond with one of the items from the list, or NULL if unsure or not in the list. If two items in the image, only respond with one item. Do not give me any response other than NULL or the name of the item."
+    # Retries are handled by classify_crops so the SDK must not retry on its own
+    api = client.with_options(timeout=timeout, max_retries=0) if timeout else client
+    response = api.messages.create(
         model="claude-3-7-sonnet-20250219",  
         max_tokens=1000,
         messages=[{
             "role": "user",
             "content": [
-                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": image_data}},
+                image_block(image, "crop"),
                 {"type": "text", "text": prompt}
             ]
         }]
@@ -86,6 +225,187 @@ def classify_image_with_claude(image_path, allowed_items):
 
     return response.content[0].text
 
+# Transient failures worth retrying (APITimeoutError is an APIConnectionError).
+# Anything else, such as a bad API key or a rejected request, fails the same way
+# every time, so it is raised at once instead of labelling every crop NULL.
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+def classify_with_retry(image, allowed_items, timeout=CLASSIFY_TIMEOUT, retries=CLASSIFY_RETRIES, backoff=CLASSIFY_BACKOFF):
+    """Classify one crop, retrying with exponential backoff and jitter.
+
+    Returns a result dict with the label, the wall time spent on this crop
+    (including retries) and the number of attempts. A crop that still fails
+    after all retries is labelled NULL so it is skipped like an unsure answer;
+    errors that are not RETRYABLE_ERRORS are raised.
+    """
+    start = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            label = classify_image_with_claude(image, allowed_items, timeout=timeout)
+            return {"label": label, "latency": time.perf_counter() - start, "attempts": attempt}
+        except RETRYABLE_ERRORS as e:
+            error = e
+            if attempt <= retries:
+                delay = backoff * (2 ** (attempt - 1))
+                time.sleep(delay + random.uniform(0, delay / 2))
+    print(f"Giving up on crop after {retries + 1} attempts: {error}")
+    return {"label": "NULL", "latency": time.perf_counter() - start, "attempts": retries + 1, "error": str(error)}
+
+def parse_allowed_items(allowed_items):
+    """Split the comma separated inventory answer into unique lowercase item names, keeping order."""
+    items, seen = [], set()
+    for item in allowed_items.split(","):
+        item = item.strip().lower()
+        # "White beans" and "white bean" are the same item; keep the first spelling
+        key = normalize_label(item)
+        if key and key not in seen:
+            seen.add(key)
+            items.append(item)
+    return items
+
+def classify_batch_with_claude(images, allowed_items, timeout=None):
+    """Classify several crops in one request.
+
+    Each crop is sent as its own image block preceded by its index. Returns a
+    dict of crop index -> label for every index the model answered; labels
+    outside allowed_items become NULL. Raises ValueError when the answer
+    cannot be parsed at all.
+    """
+    items = parse_allowed_items(allowed_items)
+    content = []
+    for idx, image in enumerate(images):
+        content.append({"type": "text", "text": f"Crop {idx}:"})
+        content.append(image_block(image, "crop"))
+    content.append({"type": "text", "text": f"For each crop above, identify which one of the following items it is (if any): {', '.join(items)}. Respond with only a JSON object mapping every crop number to one item from the list, or NULL if unsure or not in the list, e.g. {{\"0\": \"{items[0] if items else 'milk'}\", \"1\": \"NULL\"}}. If two items are in a crop, only give one. Do not give any other text."})
+
+    api = client.with_options(timeout=timeout, max_retries=0) if timeout else client
+    response = api.messages.create(
+        model="claude-3-7-sonnet-20250219",
+        max_tokens=60 * len(images) + 100,
+        messages=[{"role": "user", "content": content}]
+    )
+
+    text = response.content[0].text
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start == -1 or end <= start:
+        raise ValueError(f"No JSON object in batched answer: {text!r}")
+    answer = json.loads(text[start:end])
+    if not isinstance(answer, dict):
+        raise ValueError(f"Batched answer is not a JSON object: {text!r}")
+
+    labels = {}
+    for key, label in answer.items():
+        try:
+            idx = int(key)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < len(images) and isinstance(label, str):
+            label = label.strip()
+            labels[idx] = label.lower() if label.lower() in items else "NULL"
+    return labels
+
+def classify_batch_with_retry(images, allowed_items, timeout=CLASSIFY_TIMEOUT, retries=CLASSIFY_RETRIES, backoff=CLASSIFY_BACKOFF):
+    """Classify one batch of crops, falling back to per-crop calls for every crop the batch did not answer."""
+    start = time.perf_counter()
+    labels = {}
+    for attempt in range(1, retries + 2):
+        try:
+            labels = classify_batch_with_claude(images, allowed_items, timeout=timeout)
+            break
+        except ValueError as e:
+            # The model answered but not in the expected shape; asking again rarely helps
+            print(f"Could not parse batched answer, falling back to per-crop calls: {e}")
+            break
+        except RETRYABLE_ERRORS as e:
+            if attempt > retries:
+                print(f"Batched request failed after {attempt} attempts, falling back to per-crop calls: {e}")
+                break
+            delay = backoff * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay / 2))
+    latency = time.perf_counter() - start
+
+    results = []
+    for idx, image in enumerate(images):
+        if idx in labels:
+            results.append({"label": labels[idx], "latency": latency, "attempts": attempt, "batched": True})
+        else:
+            results.append(classify_with_retry(image, allowed_items, timeout, retries, backoff))
+    return results
+
+def classify_crops(crops, allowed_items, mode=CLASSIFY_MODE, max_in_flight=CLASSIFY_MAX_IN_FLIGHT, timeout=CLASSIFY_TIMEOUT, retries=CLASSIFY_RETRIES, backoff=CLASSIFY_BACKOFF, batch_size=CLASSIFY_BATCH_SIZE, cache=classification_cache, local=local_classifier, on_done=None):
+    """Classify crops (bytes or paths); results are returned in the same order as crops.
+
+    Crops go through up to three tiers: the perceptual-hash cache, the local
+    zero-shot classifier (when installed) and finally the vision model for
+    whatever is left or too uncertain. Failed calls are not cached. on_done,
+    if given, is called with the number of crops that just finished, from
+    any thread.
+    """
+    if not crops:
+        return []
+    items = parse_allowed_items(allowed_items)
+    results = [None] * len(crops)
+    keys = [None] * len(crops)
+    if cache is not None:
+        for idx, crop in enumerate(crops):
+            start = time.perf_counter()
+            keys[idx] = cache.make_key(read_image_bytes(crop), items)
+            label = cache.get(keys[idx])
+            if label is not None:
+                results[idx] = {"label": label, "latency": time.perf_counter() - start, "attempts": 0, "tier": "cache"}
+        hits = sum(1 for result in results if result is not None)
+        print(f"Classification cache: {hits} hits, {len(crops) - hits} misses ({cache.stats()})")
+
+    misses = [idx for idx, result in enumerate(results) if result is None]
+    if local is not None and misses and items:
+        start = time.perf_counter()
+        answers = local.classify([read_image_bytes(crops[idx]) for idx in misses], items)
+        latency = (time.perf_counter() - start) / len(misses)
+        for idx, (label, confidence) in zip(misses, answers):
+            if label is not None:
+                results[idx] = {"label": label, "latency": latency, "attempts": 0, "tier": "local", "confidence": confidence}
+                if cache is not None:
+                    cache.set(keys[idx], label)
+
+    remaining = [idx for idx, result in enumerate(results) if result is None]
+    if on_done and len(remaining) < len(crops):
+        on_done(len(crops) - len(remaining))
+    start = time.perf_counter()
+    fresh = classify_crops_remote([crops[idx] for idx in remaining], allowed_items, mode, max_in_flight, timeout, retries, backoff, batch_size, on_done)
+    for idx, result in zip(remaining, fresh):
+        result["tier"] = "remote"
+        results[idx] = result
+        if cache is not None and "error" not in result:
+            cache.set(keys[idx], result["label"])
+    if local is not None:
+        local.record_remote(len(remaining), time.perf_counter() - start)
+        print(f"Local classifier: {local.stats()}")
+    return results
+
+def classify_crops_remote(crops, allowed_items, mode=CLASSIFY_MODE, max_in_flight=CLASSIFY_MAX_IN_FLIGHT, timeout=CLASSIFY_TIMEOUT, retries=CLASSIFY_RETRIES, backoff=CLASSIFY_BACKOFF, batch_size=CLASSIFY_BATCH_SIZE, on_done=None):
+    """Classify crops with the vision model concurrently, in crop order.
+
+    In "batched" mode every request carries up to batch_size crops and
+    max_in_flight bounds the number of batches in flight instead of crops.
+    """
+    if not crops:
+        return []
+    if mode == "batched":
+        batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(batches)))) as pool:
+            futures = [pool.submit(classify_batch_with_retry, batch, allowed_items, timeout, retries, backoff) for batch in batches]
+            if on_done:
+                for future, batch in zip(futures, batches):
+                    future.add_done_callback(lambda _, n=len(batch): on_done(n))
+            return [result for future in futures for result in future.result()]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(crops)))) as pool:
+        futures = [pool.submit(classify_with_retry, crop, allowed_items, timeout, retries, backoff) for crop in crops]
+        if on_done:
+            for future in futures:
+                future.add_done_callback(lambda _: on_done(1))
+        return [future.result() for future in futures]
+
 def get_color(item):
     """Generate a consistent BGR color for an item string."""
     h = hashlib.md5(item.encode()).hexdigest()
@@ -94,15 +414,11 @@ def get_color(item):
     b = int(h[4:6], 16)
     return (b, g, r)  # OpenCV uses BGR
 
-def update_label_and_draw(original_image_path, new_label, box, allowed_items, output_path):
-    if new_label == "NULL":
-        return (-1,-1,-1,-1) # Skip this box
-    
-    # Determine color based on label
-    color = get_color(new_label if new_label in allowed_items else "other")
-    
-    # Read the image
-    img = cv2.imread(output_path)
+def draw_detection(img, label, box):
+    """Draw one labelled box onto an in-memory BGR image."""
+    # Colour by normalized label only, so scan renders and re-renders of an
+    # edited set agree, and "White Beans" / "white bean" share a colour
+    color = get_color(normalize_label(label) or "other")
     
     # Convert box coordinates to integers
     xA, yA, xB, yB = map(int, box)
@@ -111,7 +427,7 @@ def update_label_and_draw(original_image_path, new_label, box, allowed_items, ou
     cv2.rectangle(img, (xA, yA), (xB, yB), color, 2)
     
     # Add a background to the text for better readability
-    text = new_label
+    text = label
     font = cv2.FONT_HERSHEY_SIMPLEX
     font_scale = 0.6  # Slightly larger text
     thickness = 2     # Thicker text
@@ -133,13 +449,68 @@ def update_label_and_draw(original_image_path, new_label, box, allowed_items, ou
     
     # Draw text
     cv2.putText(img, text, (text_x, text_y - 4), font, font_scale, text_color, thickness)
+
+def render_detections(image, detections, output_path=None, ext=".jpg"):
+    """Draw every detection onto the image in one pass and encode it once.
+
+    image is a path or encoded image bytes, detections is the
+    {id: {"label": ..., "box": [xA, yA, xB, yB]}} structure returned by
+    run_all and held by main.detection_data. Returns the encoded image bytes
+    and also writes them to output_path when given.
+    """
+    img = cv2.imdecode(np.frombuffer(read_image_bytes(image), np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image for rendering")
+    for detection in detections.values():
+        if detection["label"] == "NULL":
+            continue
+        draw_detection(img, detection["label"], detection["box"])
+
+    if output_path:
+        ext = os.path.splitext(output_path)[1] or ext
+    ok, encoded = cv2.imencode(ext, img)
+    if not ok:
+        raise ValueError(f"Could not encode rendered image as {ext}")
+    data = encoded.tobytes()
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(data)
+    return data
     
-    # Save the output image
-    cv2.imwrite(output_path, img)
-    
-    return (xA, yA, xB, yB)
-    
-def run_all(pred_image_name, crop_folder_name):
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the block to timings[stage] (no-op when timings is None)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def run_all(pred_image_name, crop_folder_name=None, on_progress=None):
+    """Detect, classify and render one image from data/img_to_predict.
+
+    on_progress, if given, is called as on_progress(boxes_done, boxes_total)
+    while crops are being classified.
+    """
+    return scan(pred_image_name, crop_folder_name, on_progress)[0]
+
+def scan(pred_image_name, crop_folder_name=None, on_progress=None, previous=None, timings=None):
+    """run_all, optionally as an incremental re-scan of the same pantry.
+
+    previous is the detection set of the last scan of this pantry. New boxes
+    that overlap a previous box (IoU >= REUSE_MIN_IOU) and look the same
+    (dhash distance <= REUSE_MAX_HASH_DISTANCE) keep its label without a
+    model call; only the remaining boxes are classified. Returns
+    (detections, diff) where diff lists added and kept detection ids and
+    removed ids of the previous set, or diff is None for a full scan. The
+    inventory call overlaps detection only for full scans; an incremental scan
+    makes it after matching, and not at all when every label is reused.
+
+    timings, if given, is filled with seconds spent per stage: detection,
+    cropping, inventory (the call itself, which may overlap detection),
+    inventory_wait, classification, drawing and io.
+    """
     d = {
         
     }
@@ -147,47 +518,202 @@ def run_all(pred_image_name, crop_folder_name):
     pred_path = os.path.join(pred_folder, pred_image_name)
     name = os.path.splitext(pred_image_name)[0]
     output_path =  os.path.join(result_folder, pred_image_name)
-    shutil.copy(pred_path, output_path)
-    imgs_path = os.path.join(image_dir, crop_folder_name)
-    res = make_prediction(crop_folder_name, pred_path)
-    allowed_items = get_all_pantry_items_from_full_image(pred_path)
-    cropped_images = get_all_image_files(imgs_path)
+    def inventory_call():
+        with timed(timings, "inventory"):
+            return get_all_pantry_items_from_full_image(pred_path)
+    # An incremental scan may reuse every label, so it only asks for the
+    # inventory once it knows some boxes still need classifying; a call that
+    # has started runs to completion (and is billed) even if nobody waits for it
+    inventory_pool = ThreadPoolExecutor(max_workers=1) if INVENTORY_CONCURRENT and not previous else None
+    inventory = inventory_pool.submit(inventory_call) if inventory_pool else None
+    with timed(timings, "detection"):
+        boxes, scores = detect_boxes(pred_path)
+    with timed(timings, "cropping"):
+        with Image.open(pred_path) as image:
+            # Drop duplicate, whole-frame and tiny boxes before paying for their classification
+            keep = filter_boxes(boxes, scores, image.size)
+            print(f"Keeping {len(keep)} of {len(boxes)} detected boxes")
+            res = boxes[keep]
+            cropped_images = crop_images(image, res)
+        hashes = [dhash(crop) for crop in cropped_images]
+    if CROP_DEBUG and crop_folder_name:
+        with timed(timings, "io"):
+            save_crops(cropped_images, crop_folder_name)
+
+    # Reuse labels of boxes that did not change since the previous scan
+    reused = {}
+    if previous:
+        previous_ids = list(previous)
+        def same_look(i, j):
+            old_hash = previous[previous_ids[j]].get("phash")
+            return old_hash is None or hash_distance(hashes[i], old_hash) <= REUSE_MAX_HASH_DISTANCE
+        matches = match_boxes(res.tolist(), [previous[k]["box"] for k in previous_ids], REUSE_MIN_IOU, same_look)
+        reused = {i: previous_ids[j] for i, j in matches.items()}
+        print(f"Incremental scan: reusing {len(reused)} of {len(cropped_images)} labels from the previous scan")
+    to_classify = [i for i in range(len(cropped_images)) if i not in reused]
+
+    if inventory is not None:
+        if to_classify:
+            with timed(timings, "inventory_wait"):
+                allowed_items = inventory.result()
+        else:
+            allowed_items = None
+        inventory_pool.shutdown(wait=False)
+    else:
+        allowed_items = inventory_call() if to_classify else None
+
+    progress = {"done": len(reused)}
+    progress_lock = threading.Lock()
+    def crop_done(n):
+        with progress_lock:
+            progress["done"] += n
+            if on_progress:
+                on_progress(progress["done"], len(cropped_images))
+    if on_progress:
+        on_progress(progress["done"], len(cropped_images))
+
+    start = time.perf_counter()
+    with timed(timings, "classification"):
+        fresh = classify_crops([cropped_images[i] for i in to_classify], allowed_items, on_done=crop_done) if to_classify else []
+    if fresh:
+        latencies = [r["latency"] for r in fresh]
+        print(f"Classified {len(fresh)} crops in {time.perf_counter() - start:.2f}s (slowest crop {max(latencies):.2f}s, mean {sum(latencies) / len(latencies):.2f}s)")
+    results = {i: result for i, result in zip(to_classify, fresh)}
+
+    diff = {"added": [], "kept": [], "removed": []} if previous is not None else None
     j=0
-    for i, img_path in enumerate(cropped_images):
-        print(f"Processing: {img_path}")
-        label = classify_image_with_claude(img_path, allowed_items)
-        print(f" → Claude label: {label}")
-        xA, yA, xB, yB = update_label_and_draw(pred_path, label, res[i], allowed_items, output_path)
-        if (xA != -1):
-            j+= 1
-            d[j] = {
-                "label": label,
-                "box": [xA, yA, xB, yB]
-            }
-    return d
+    for i in range(len(cropped_images)):
+        if i in reused:
+            label = previous[reused[i]]["label"]
+        else:
+            label = results[i]["label"]
+            print(f"Processed crop {i} → Claude label: {label} ({results[i]['latency']:.2f}s, {results[i]['attempts']} attempt(s))")
+        if label == "NULL":
+            continue # Skip this box
+        j+= 1
+        d[j] = {
+            "label": label,
+            "box": [int(v) for v in res[i]],
+            "phash": hashes[i]
+        }
+        if diff is not None:
+            if i in reused:
+                diff["kept"].append({"id": j, "previous_id": reused[i]})
+            else:
+                diff["added"].append(j)
+    if diff is not None:
+        kept_previous = set(reused.values())
+        diff["removed"] = [k for k in previous if k not in kept_previous]
 
-def get_all_labels(d):
-    labels = [item["label"] for item in d.values()]
-    return ", ".join(labels)
+    with timed(timings, "drawing"):
+        rendered = render_detections(pred_path, d, ext=os.path.splitext(output_path)[1] or ".jpg")
+    with timed(timings, "io"):
+        with open(output_path, "wb") as f:
+            f.write(rendered)
+    stats = payload_stats()
+    print(f"Vision payloads: {stats['images']} images, {stats['original_bytes']} → {stats['sent_bytes']} bytes ({stats['saved_ratio']:.0%} saved)")
+    return d, diff
 
-def get_all_pantry_items_from_full_image(image_path):
-    with open(image_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode("utf-8")
+def render_contact_sheet(views, ext=".jpg"):
+    """Lay out labelled (label, crop bytes) views in a grid and return the encoded image.
 
-    response = client.messages.create(
-        model="claude-3-7-sonnet-20250219",  
-        max_tokens=1000,
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": image_data}},
-                {"type": "text", "text": "Scan each food or pantry item in this image and list only FOODS as lower-case nouns separated by commas and repeat items if you see more than one. Be as specific as possible. Only include full/recognizable items."}
-            ]
-        }]
-    )
-    # Example response: "lettuce, tomato, milk, cheese"
-    return response.content[0].text.strip()
+    A video sweep has no single frame showing every item, so its rendered
+    result is a sheet of each item's best view, coloured like render_detections.
+    """
+    columns = max(1, min(SHEET_COLUMNS, len(views)))
+    rows = max(1, -(-len(views) // columns))
+    label_height = 28
+    sheet = np.full((rows * (SHEET_TILE + label_height), columns * SHEET_TILE, 3), 255, np.uint8)
+    for idx, (label, crop) in enumerate(views):
+        img = cv2.imdecode(np.frombuffer(crop, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        scale = SHEET_TILE / max(img.shape[:2])
+        img = cv2.resize(img, (max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+        x = (idx % columns) * SHEET_TILE
+        y = (idx // columns) * (SHEET_TILE + label_height)
+        sheet[y:y + img.shape[0], x:x + img.shape[1]] = img
+        color = get_color(normalize_label(label) or "other")
+        cv2.rectangle(sheet, (x, y + SHEET_TILE), (x + SHEET_TILE - 1, y + SHEET_TILE + label_height - 1), color, -1)
+        text_color = (0, 0, 0) if sum(color) > 384 else (255, 255, 255)
+        cv2.putText(sheet, label[:24], (x + 4, y + SHEET_TILE + 19), cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1)
+    ok, encoded = cv2.imencode(ext, sheet)
+    if not ok:
+        raise ValueError("Could not encode contact sheet")
+    return encoded.tobytes()
+
+def scan_video(source, stride=VIDEO_STRIDE, min_hits=TRACK_MIN_HITS, keyframes=VIDEO_KEYFRAMES, output_path=None, on_progress=None):
+    """Scan a pantry sweep (video path or sequence of frames) into one deduplicated detection set.
+
+    Frames are decoded and detected one at a time and boxes are tracked across
+    frames, so every physical item is classified once, from its best view.
+    Each detection's box is in the coordinates of the frame given by "frame".
+    With output_path, a contact sheet of the labelled best views is written
+    there. on_progress is called as on_progress(items_done, items_total).
+    """
+    tracker = IoUTracker()
+    busiest = []  # min-heap of (box count, frame index, encoded frame)
+    frames = 0
+    start = time.perf_counter()
+    for frame_index, frame in iter_frames(source, stride):
+        frames += 1
+        boxes, scores = get_engine().predict([frame])[0]
+        keep = filter_boxes(boxes, scores, (frame.shape[1], frame.shape[0]))
+        tracker.update(frame_index, frame, boxes[keep].tolist(), scores[keep].tolist())
+        if len(busiest) < keyframes or len(keep) > busiest[0][0]:
+            ok, encoded = cv2.imencode(".jpg", frame)
+            if ok:
+                entry = (len(keep), frame_index, encoded.tobytes())
+                if len(busiest) < keyframes:
+                    heapq.heappush(busiest, entry)
+                else:
+                    heapq.heapreplace(busiest, entry)
+    tracks = tracker.tracks(min_hits)
+    print(f"Video scan: {frames} frames in {time.perf_counter() - start:.2f}s, {len(tracks)} tracked objects")
+    if on_progress:
+        on_progress(0, len(tracks))
+    if not tracks:
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(render_contact_sheet([], ext=os.path.splitext(output_path)[1] or ".jpg"))
+        return {}
+
+    # The inventory is the union of what the busiest frames show
+    with ThreadPoolExecutor(max_workers=max(1, len(busiest))) as pool:
+        answers = list(pool.map(lambda entry: get_inventory(entry[2], "all"), busiest))
+    allowed_items = ", ".join(item for answer in answers for item in parse_allowed_items(answer))
 
+    track_ids = list(tracks)
+    progress = {"done": 0}
+    progress_lock = threading.Lock()
 
+    def crop_done(count):
+        with progress_lock:
+            progress["done"] += count
+            if on_progress:
+                on_progress(progress["done"], len(track_ids))
 
+    results = classify_crops([tracks[t]["crop"] for t in track_ids], allowed_items, on_done=crop_done)
+    d = {}
+    j = 0
+    for track_id, result in zip(track_ids, results):
+        if result["label"] == "NULL":
+            continue
+        j += 1
+        track = tracks[track_id]
+        d[j] = {
+            "label": result["label"],
+            "box": track["best_box"],
+            "frame": track["best_frame"],
+            "phash": dhash(track["crop"])
+        }
 
+    if output_path:
+        views = [(result["label"], tracks[track_id]["crop"]) for track_id, result in zip(track_ids, results) if result["label"] != "NULL"]
+        with open(output_path, "wb") as f:
+            f.write(render_contact_sheet(views, ext=os.path.splitext(output_path)[1] or ".jpg"))
+    return d
+
+def get_all_labels(d):
+    labels = [item["label"] for item in d.values()]
+    return ", ".join(labels)
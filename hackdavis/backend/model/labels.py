@@ -0,0 +1,56 @@
+import re
+from functools import lru_cache
+
+# Bump whenever the rules below change, so stored label counts get rebuilt
+NORMALIZATION_VERSION = 2
+
+# Different names the vision model uses for the same pantry item, folded to one
+# canonical name. Keys and values are already in normalized (singular) form.
+SYNONYMS = {
+    "ramen": "ramen noodle",
+    "instant ramen": "ramen noodle",
+    "ichiban ramen noodle": "ramen noodle",
+    "garbanzo bean": "chickpea",
+    "elbow macaroni": "pasta elbow",
+    "macaroni": "pasta elbow",
+    "marinara sauce": "pasta sauce",
+    "tomato sauce": "pasta sauce",
+    "chicken stock": "chicken broth",
+    "soda": "soft drink",
+    "pop": "soft drink",
+}
+
+# Irregular plurals, and words ending in "s" that are not plurals
+SINGULAR_EXCEPTIONS = {
+    "molasses": "molasses", "leaves": "leaf", "loaves": "loaf", "halves": "half",
+    "potatoes": "potato", "tomatoes": "tomato", "mangoes": "mango",
+}
+
+# Singulars ending in "ie", whose plural "-ies" must not become "-y" ("cookies" -> "cookie")
+IE_SINGULARS = {"cookie", "pie", "brownie", "smoothie", "veggie", "hoagie", "pastie"}
+
+
+def singularize(word):
+    if word in SINGULAR_EXCEPTIONS:
+        return SINGULAR_EXCEPTIONS[word]
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-1] if word[:-1] in IE_SINGULARS else word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses")):
+        return word[:-2]
+    return word[:-1]
+
+
+@lru_cache(maxsize=4096)
+def normalize_label(label):
+    """Canonical form of an item label: lowercase, single spaces, singular words, synonyms folded.
+
+    "NULL" (the classifier's "no item") and empty labels normalize to "".
+    """
+    text = re.sub(r"[^a-z0-9&' ]+", " ", str(label).lower())
+    words = [singularize(word) for word in text.split()]
+    text = " ".join(words)
+    if text == "null":
+        return ""
+    return SYNONYMS.get(text, text)
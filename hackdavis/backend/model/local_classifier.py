@@ -0,0 +1,110 @@
+import importlib.util
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+# Opt-in: enabling it downloads the CLIP weights on the first scan
+LOCAL_CLASSIFIER = os.getenv("LOCAL_CLASSIFIER", "0") == "1"
+LOCAL_CLASSIFIER_MODEL = os.getenv("LOCAL_CLASSIFIER_MODEL", "openai/clip-vit-base-patch32")
+# Crops whose best match is less likely than this are escalated to the vision model
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.6"))
+LABEL_CACHE_ENTRIES = 32
+# Competing "none of the items" classes. YOLO runs at a very low confidence, so
+# many crops are shelf, background or non-food; without these the softmax over
+# the allowed items alone would still label them confidently.
+NEGATIVE_PROMPTS = ["a photo of something else", "a photo of an empty shelf", "a photo of a blurry background", "a photo of a non-food object"]
+
+
+def is_available():
+    """Whether the tier is enabled and torch/transformers are installed, checked without importing them.
+
+    Optional dependency: without them every crop goes to the vision model as before.
+    """
+    return LOCAL_CLASSIFIER and all(importlib.util.find_spec(name) is not None for name in ("torch", "transformers"))
+
+
+class LocalClassifier:
+    """CPU zero-shot crop classifier: embeds crops and allowed item names with CLIP and picks the closest item."""
+
+    def __init__(self, model_name=LOCAL_CLASSIFIER_MODEL, threshold=LOCAL_CLASSIFIER_THRESHOLD):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.model = None
+        self.processor = None
+        self.lock = threading.Lock()
+        self.label_cache = OrderedDict()
+        self.counters = {"crops": 0, "accepted": 0, "escalated": 0, "local_seconds": 0.0, "remote_crops": 0, "remote_seconds": 0.0}
+
+    def load(self):
+        if self.model is None:
+            # Imported here so API processes that never classify locally do not pay for transformers
+            from transformers import CLIPModel, CLIPProcessor
+
+            start = time.perf_counter()
+            self.model = CLIPModel.from_pretrained(self.model_name).eval()
+            self.processor = CLIPProcessor.from_pretrained(self.model_name)
+            print(f"Loaded local classifier {self.model_name} in {time.perf_counter() - start:.2f}s")
+
+    def label_embeddings(self, items):
+        """Normalised text embeddings for an allowed-items list followed by NEGATIVE_PROMPTS, cached per list."""
+        key = tuple(items)
+        if key in self.label_cache:
+            self.label_cache.move_to_end(key)
+            return self.label_cache[key]
+        inputs = self.processor(text=[f"a photo of {item}" for item in items] + NEGATIVE_PROMPTS, return_tensors="pt", padding=True)
+        embeddings = self.model.get_text_features(**inputs)
+        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        self.label_cache[key] = embeddings
+        while len(self.label_cache) > LABEL_CACHE_ENTRIES:
+            self.label_cache.popitem(last=False)
+        return embeddings
+
+    def classify(self, crops, items):
+        """Return (label, confidence) per crop; label is None when the crop should be escalated.
+
+        A crop is escalated when a negative prompt wins or the best item is
+        below the threshold.
+        """
+        if not crops or not items:
+            return [(None, 0.0)] * len(crops)
+        import torch
+
+        start = time.perf_counter()
+        with self.lock, torch.no_grad():
+            self.load()
+            labels = self.label_embeddings(items)
+            images = [Image.open(io.BytesIO(crop)).convert("RGB") for crop in crops]
+            inputs = self.processor(images=images, return_tensors="pt")
+            embeddings = self.model.get_image_features(**inputs)
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+            probs = (self.model.logit_scale.exp() * embeddings @ labels.T).softmax(dim=-1)
+            confidence, best = probs.max(dim=-1)
+
+        answers = []
+        for conf, idx in zip(confidence.tolist(), best.tolist()):
+            is_item = idx < len(items) and conf >= self.threshold
+            answers.append((items[idx], conf) if is_item else (None, conf))
+        accepted = sum(1 for label, _ in answers if label is not None)
+        with self.lock:
+            self.counters["crops"] += len(crops)
+            self.counters["accepted"] += accepted
+            self.counters["escalated"] += len(crops) - accepted
+            self.counters["local_seconds"] += time.perf_counter() - start
+        return answers
+
+    def record_remote(self, crops, seconds):
+        with self.lock:
+            self.counters["remote_crops"] += crops
+            self.counters["remote_seconds"] += seconds
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["escalation_rate"] = stats["escalated"] / stats["crops"] if stats["crops"] else 0.0
+        stats["local_ms_per_crop"] = stats["local_seconds"] * 1000 / stats["crops"] if stats["crops"] else 0.0
+        stats["remote_ms_per_crop"] = stats["remote_seconds"] * 1000 / stats["remote_crops"] if stats["remote_crops"] else 0.0
+        return stats
@@ -0,0 +1,61 @@
+import base64
+import io
+import os
+import threading
+
+from PIL import Image
+
+# Images are resized and re-encoded before they are sent to the vision model.
+# Full-frame inventory calls need enough detail to read labels across the
+# whole shelf; crops are small already and only need to show one item.
+PRESETS = {
+    "inventory": {
+        "max_side": int(os.getenv("INVENTORY_MAX_SIDE", "1568")),
+        "quality": int(os.getenv("INVENTORY_JPEG_QUALITY", "85")),
+    },
+    "crop": {
+        "max_side": int(os.getenv("CROP_MAX_SIDE", "384")),
+        "quality": int(os.getenv("CROP_JPEG_QUALITY", "80")),
+    },
+}
+
+MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
+
+counters = {"images": 0, "original_bytes": 0, "sent_bytes": 0}
+counters_lock = threading.Lock()
+
+
+def encode_for_model(data, preset="crop"):
+    """Resize and re-encode image bytes for upload to the vision model.
+
+    Returns (base64 data, media type). The original bytes are kept when they
+    are already small enough and re-encoding would not make them smaller.
+    """
+    settings = PRESETS[preset]
+    with Image.open(io.BytesIO(data)) as image:
+        media_type = MEDIA_TYPES.get(image.format)
+        resize = max(image.size) > settings["max_side"]
+        encoded = data
+        if resize or media_type is None or len(data) > 64 * 1024:
+            converted = image.convert("RGB")
+            if resize:
+                converted.thumbnail((settings["max_side"], settings["max_side"]), Image.LANCZOS)
+            buffer = io.BytesIO()
+            converted.save(buffer, format="JPEG", quality=settings["quality"], optimize=True)
+            if resize or media_type is None or buffer.tell() < len(data):
+                encoded = buffer.getvalue()
+                media_type = "image/jpeg"
+
+    with counters_lock:
+        counters["images"] += 1
+        counters["original_bytes"] += len(data)
+        counters["sent_bytes"] += len(encoded)
+    return base64.b64encode(encoded).decode("utf-8"), media_type
+
+
+def payload_stats():
+    with counters_lock:
+        stats = dict(counters)
+    stats["saved_bytes"] = stats["original_bytes"] - stats["sent_bytes"]
+    stats["saved_ratio"] = stats["saved_bytes"] / stats["original_bytes"] if stats["original_bytes"] else 0.0
+    return stats
@@ -0,0 +1,109 @@
+import os
+
+import cv2
+
+from model.boxes import box_area, match_boxes
+
+TRACK_MIN_IOU = float(os.getenv("TRACK_MIN_IOU", "0.3"))
+# Frames a track may go unseen before it is closed
+TRACK_MAX_MISSED = int(os.getenv("TRACK_MAX_MISSED", "10"))
+# Tracks seen in fewer frames are treated as detector noise
+TRACK_MIN_HITS = int(os.getenv("TRACK_MIN_HITS", "3"))
+
+
+def iter_frames(source, stride=1):
+    """Yield (frame index, BGR frame) one at a time from a video path or a sequence of frames/image paths.
+
+    Only the current frame is held in memory, so clip length does not matter.
+    """
+    if isinstance(source, str):
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video {source}")
+        try:
+            index = 0
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                if index % stride == 0:
+                    yield index, frame
+                index += 1
+        finally:
+            capture.release()
+        return
+
+    for index, frame in enumerate(source):
+        if index % stride:
+            continue
+        if isinstance(frame, str):
+            frame = cv2.imread(frame)
+            if frame is None:
+                continue
+        yield index, frame
+
+
+def sharpness(image):
+    """Variance of the Laplacian: higher means less motion blur."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+class IoUTracker:
+    """Minimal multi-object tracker associating boxes between consecutive frames by IoU.
+
+    Every track keeps only its best view so far (sharpest, most confident,
+    largest crop) as encoded JPEG bytes, so memory grows with the number of
+    objects, not the number of frames.
+    """
+
+    def __init__(self, min_iou=TRACK_MIN_IOU, max_missed=TRACK_MAX_MISSED):
+        self.min_iou = min_iou
+        self.max_missed = max_missed
+        self.active = {}
+        self.finished = {}
+        self.next_id = 1
+
+    def update(self, frame_index, frame, boxes, scores):
+        ids = list(self.active)
+        matches = match_boxes(boxes, [self.active[i]["box"] for i in ids], self.min_iou)
+
+        seen = set()
+        for idx, (box, score) in enumerate(zip(boxes, scores)):
+            if idx in matches:
+                track_id = ids[matches[idx]]
+            else:
+                track_id = self.next_id
+                self.next_id += 1
+                self.active[track_id] = {"hits": 0, "quality": -1.0}
+            track = self.active[track_id]
+            track["box"] = box
+            track["hits"] += 1
+            track["missed"] = 0
+            seen.add(track_id)
+            self._consider_view(track, frame_index, frame, box, score)
+
+        for track_id in ids:
+            if track_id not in seen:
+                self.active[track_id]["missed"] += 1
+                if self.active[track_id]["missed"] > self.max_missed:
+                    self.finished[track_id] = self.active.pop(track_id)
+
+    @staticmethod
+    def _consider_view(track, frame_index, frame, box, score):
+        x_min, y_min, x_max, y_max = (int(v) for v in box)
+        crop = frame[max(0, y_min):y_max, max(0, x_min):x_max]
+        if crop.size == 0:
+            return
+        quality = float(score) * box_area(box) ** 0.5 * sharpness(crop) ** 0.5
+        if quality <= track["quality"]:
+            return
+        ok, encoded = cv2.imencode(".jpg", crop)
+        if ok:
+            track.update(quality=quality, crop=encoded.tobytes(), best_box=[x_min, y_min, x_max, y_max], best_frame=frame_index)
+
+    def tracks(self, min_hits=TRACK_MIN_HITS):
+        """All tracks (open and closed) confirmed in at least min_hits frames, by track id."""
+        tracks = {**self.finished, **self.active}
+        return {track_id: track for track_id, track in sorted(tracks.items())
+                if track["hits"] >= min_hits and "crop" in track}
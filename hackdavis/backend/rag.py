@@ -1,21 +1,15 @@
 import os
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.question_answering import load_qa_chain
-from pinecone import Pinecone, ServerlessSpec
 from langchain_pinecone import PineconeVectorStore
-from langchain_ollama import OllamaEmbeddings
-from langchain_cerebras import ChatCerebras
 import streamlit as st
+from clients import get_clients, INDEX_NAME
 
 # === CONFIGURATION ===
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
 
-INDEX_NAME = "hackdavis-rag-index"
-EMBEDDING_DIM = 768
-
 # === LOAD AND PROCESS PDF ===
 def load_and_split_pdf(pdf_path):
     loader = PyPDFLoader(pdf_path)
@@ -25,43 +19,43 @@ def load_and_split_pdf(pdf_path):
     return splitter.split_documents(data)
 
 # === UPLOAD VECTORS TO PINECONE ===
-def upload_vectors(texts, embeddings, index_name):
-    vector_store = PineconeVectorStore(index_name=index_name, embedding=embeddings)
-    for t in texts:
-        vector_store.add_texts([t.page_content])
+def upload_vectors(texts, embeddings=None, index_name=INDEX_NAME):
+    if embeddings is None:
+        vector_store = init_pinecone_index(index_name)
+    else:
+        vector_store = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+    # One batched upsert, keeping metadata such as resident_id for filtered search
+    vector_store.add_documents(texts)
     print("uploaded vectors to pinecone")
     return vector_store
 
+# === "STUFF" PROMPT ===
+# Same template load_qa_chain(chain_type="stuff") uses, so the LLM can be called
+# directly (e.g. with llm.stream) and still answer the same way
+STUFF_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+
+def stuff_prompt(docs, question):
+    return STUFF_PROMPT.format(context="\n\n".join(doc.page_content for doc in docs), question=question)
+
 # === INITIALIZE PINECONE INDEX ===
 def init_pinecone_index(index_name):
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    if index_name not in pc.list_indexes().names():
-        pc.create_index(
-            name=index_name,
-            dimension=EMBEDDING_DIM,
-            metric="cosine",
-            spec=ServerlessSpec(cloud='aws', region='us-east-1')
-        )
+    # Known indexes are remembered by the registry, so this is free after the first call
+    get_clients().ensure_index(index_name)
     print("initialized pinecone index")
-    return PineconeVectorStore(index_name=index_name, embedding=OllamaEmbeddings(model="nomic-embed-text"))
+    if index_name == INDEX_NAME:
+        return get_clients().vector_store
+    return PineconeVectorStore(index=get_clients().pinecone.Index(index_name), embedding=get_clients().embeddings)
 
 
 def get_docsearch_for_resident(resident_id):
     """
     Get vector search specifically filtered for a resident
     """
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
-    
-    # Use filter to only return vectors with matching resident_id
-    docsearch = PineconeVectorStore(
-        index_name="hackdavis-rag-index",
-        embedding=embeddings,
-        text_key="text",
-        pinecone_api_key=PINECONE_API_KEY,
-        filter={"resident_id": resident_id}
-    )
-
-    init_pinecone_index(INDEX_NAME)
-    
-    return docsearch
-    
+    # Shared store and connections; only the filter is per resident
+    return get_clients().vector_store.as_retriever(search_kwargs={"filter": {"resident_id": resident_id}})
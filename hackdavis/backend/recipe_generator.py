@@ -4,12 +4,13 @@ import re
 import json
 import contextlib
 from collections import Counter
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Mapping, Union
 
 from pydantic import BaseModel
 
 from supabase import create_client, Client
 from helper import load_env
+from model.labels import normalize_label
 import anthropic
 
 from cerebras.cloud.sdk import Cerebras
@@ -36,9 +37,15 @@ class ResidentInfo(BaseModel):
     foodAllergies: Optional[str] = None  
     specialSupportiveServices: Optional[str] = None  
 
-def ingredients_str_parser(ingredients_str: str):
-    counted_ingredients = Counter([ingredient.lower().strip() for ingredient in ingredients_str.split(',')])
-    lines = [f"{ingredient}: {count}" for ingredient, count in counted_ingredients.items()]
+def ingredients_str_parser(ingredients: Union[str, Mapping[str, int]]):
+    """Format the pantry as "item: count" lines.
+
+    Takes either a ready-made multiset (e.g. DetectionStore.label_counts) or
+    the older comma separated label string, which is normalized and counted here.
+    """
+    if isinstance(ingredients, str):
+        ingredients = Counter(label for label in map(normalize_label, ingredients.split(',')) if label)
+    lines = [f"{ingredient}: {count}" for ingredient, count in ingredients.items()]
     return "\n".join(lines)
 
 #print(ingredients_str_parser("Ichiban ramen noodles, dark chocolate peanut butter bar, whole grain pasta elbows, peanut butter, pasta sauce, white beans, Whole grain pasta elbows, chicken broth, ichiban ramen noodles"))
@@ -100,7 +107,7 @@ def ingredients_str_parser(ingredients_str: str):
 #     return message.content[0].text
 
 #Replace above with below when we get the cerebras API
-def generate_recipe(resident_info: ResidentInfo, ingredients_str: str, meal_type: str = None, substitution_allowed: bool = False):
+def generate_recipe(resident_info: ResidentInfo, ingredients: Union[str, Mapping[str, int]], meal_type: str = None, substitution_allowed: bool = False):
 
     if (meal_type is None):
         meal_type = "N/A"
@@ -181,7 +188,7 @@ def generate_recipe(resident_info: ResidentInfo, ingredients_str: str, meal_type
             },
             {
                 "role": "user",
-                "content": r_info_text + "\n" + ingredients_str_parser(ingredients_str) + "\nMeal Type:" + meal_type + "\nSubstitions Allowed:" + str(substitution_allowed)
+                "content": r_info_text + "\n" + ingredients_str_parser(ingredients) + "\nMeal Type:" + meal_type + "\nSubstitions Allowed:" + str(substitution_allowed)
             }
         ],
         temperature = 1.0,
@@ -199,8 +206,8 @@ def extract_json_from_text(text: str) -> str:
 
     return text[start:end]
 
-def get_dict(resident_info: ResidentInfo, ingredients_str: str, meal_type: str = None, substitution_allowed: bool = False):
-    recipe = generate_recipe(resident_info, ingredients_str)
+def get_dict(resident_info: ResidentInfo, ingredients: Union[str, Mapping[str, int]], meal_type: str = None, substitution_allowed: bool = False):
+    recipe = generate_recipe(resident_info, ingredients)
     cleaned_string = extract_json_from_text(recipe)
     recipe_dict = json.loads(cleaned_string)
     return recipe_dict
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# The supabase client is synchronous. Queries run on this bounded pool so the
+# event loop (and every WebSocket on it) keeps running while they wait on the
+# network; a query that takes longer than DB_TIMEOUT fails with TimeoutError.
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+
+async def run_blocking(fn, *args, timeout=DB_TIMEOUT, executor=db_executor, **kwargs):
+    """Run a blocking call on the database pool and await it, giving up after timeout seconds.
+
+    On timeout the worker thread finishes the call in the background, but the
+    pool size bounds how many such calls can pile up.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs)), timeout)
+
+
+def call_blocking(fn, *args, timeout=DB_TIMEOUT, executor=db_executor, **kwargs):
+    """run_blocking for code already on a worker thread: wait for the call on the database pool, up to timeout seconds."""
+    return executor.submit(functools.partial(fn, *args, **kwargs)).result(timeout)
+
+
+class Repository:
+    """Async access to one supabase table. Methods return the client's response (rows in .data)."""
+
+    table_name = None
+
+    def __init__(self, client, timeout=DB_TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+
+    def table(self):
+        return self.client.table(self.table_name)
+
+    async def run(self, build):
+        """Build a query from the table with build(table) and execute it off the event loop."""
+        return await run_blocking(lambda: build(self.table()).execute(), timeout=self.timeout)
+
+    def run_sync(self, build):
+        """run for callers on a worker thread (e.g. run_in_threadpool); raises TimeoutError after self.timeout."""
+        return call_blocking(lambda: build(self.table()).execute(), timeout=self.timeout)
+
+    async def insert(self, row):
+        return await self.run(lambda table: table.insert(row))
+
+
+class ResidentRepository(Repository):
+    table_name = "residents"
+
+    async def find_by_credentials(self, name, password):
+        return await self.run(lambda table: table.select("*").eq("name", name).eq("password", password))
+
+    async def find_by_name(self, name):
+        return await self.run(lambda table: table.select("*").eq("name", name))
+
+    def find_by_id_sync(self, resident_id):
+        return self.run_sync(lambda table: table.select("*").eq("id", resident_id))
+
+    async def list(self, *columns):
+        return await self.run(lambda table: table.select(*columns))
+
+    async def update(self, resident_id, values):
+        return await self.run(lambda table: table.update(values).eq("id", resident_id))
+
+
+class EmergencyLogRepository(Repository):
+    table_name = "emergency_logs"
+
+    async def list(self):
+        return await self.run(lambda table: table.select("*").order("timestamp", desc=True))
+
+    def latest_pending_sync(self):
+        """The most recent PENDING emergency, if any (blocking)."""
+        return self.run_sync(lambda table: table.select("*").eq("status", "PENDING").order("timestamp", desc=True).limit(1))
+
+    async def find_by_resident_name(self, resident_name):
+        return await self.run(lambda table: table.select("*").eq("resident_name", resident_name))
+
+    async def resolve_pending(self, resident_name, resolved_at):
+        return await self.run(lambda table: table.update({"status": "RESOLVED", "resolved_at": resolved_at})
+                              .eq("resident_name", resident_name).eq("status", "PENDING"))
+
+
+class NonEmergencyLogRepository(Repository):
+    table_name = "non_emergency_logs"
+
+
+class MedicalHistoryRepository(Repository):
+    table_name = "medical_histories"
+    bucket = "medicalhistorypdfs"
+
+    async def upload_pdf(self, path, contents):
+        """Store a PDF in the medical history bucket and return its public URL."""
+        def upload():
+            storage = self.client.storage.from_(self.bucket)
+            storage.upload(path, contents, file_options={"content-type": "application/pdf"})
+            return storage.get_public_url(path)
+        return await run_blocking(upload, timeout=self.timeout)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+SUMMARY_CACHE_ENTRIES = int(os.getenv("SUMMARY_CACHE_ENTRIES", "128"))
+
+
+def record_hash(record):
+    """Stable hash of a database row, used as its version."""
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class SummaryCache:
+    """Emergency summaries keyed by (emergency id, resident id, resident record hash, document index version).
+
+    Any change to those inputs yields a new key, so a stale summary is never
+    served; the invalidate_* methods additionally drop entries that can no
+    longer be hit. Concurrent requests for the same key wait for one
+    computation instead of each running retrieval and the LLM.
+    """
+
+    def __init__(self, max_entries=SUMMARY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.key_locks = {}
+        # Bumped whenever a resident's medical documents are (re)indexed
+        self.doc_versions = {}
+        self.counters = {"hits": 0, "misses": 0, "invalidated": 0}
+
+    def key(self, emergency_id, resident_id, resident_record):
+        with self.lock:
+            doc_version = self.doc_versions.get(str(resident_id), 0)
+        return (str(emergency_id), str(resident_id), record_hash(resident_record), doc_version)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached summary for key, or run compute() once and cache its result (exceptions are not cached)."""
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return self.entries[key]
+                self.counters["misses"] += 1
+            summary = compute()
+            with self.lock:
+                self.entries[key] = summary
+                while len(self.entries) > self.max_entries:
+                    evicted, _ = self.entries.popitem(last=False)
+                    self.key_locks.pop(evicted, None)
+            return summary
+
+    def _drop(self, matches):
+        with self.lock:
+            stale = [key for key in self.entries if matches(key)]
+            for key in stale:
+                del self.entries[key]
+                self.key_locks.pop(key, None)
+            self.counters["invalidated"] += len(stale)
+        return len(stale)
+
+    def invalidate_emergency(self, emergency_id):
+        return self._drop(lambda key: key[0] == str(emergency_id))
+
+    def invalidate_resident(self, resident_id):
+        return self._drop(lambda key: key[1] == str(resident_id))
+
+    def bump_documents(self, resident_id):
+        """Record that a resident's medical documents changed, making their cached summaries unreachable."""
+        with self.lock:
+            self.doc_versions[str(resident_id)] = self.doc_versions.get(str(resident_id), 0) + 1
+        return self.invalidate_resident(resident_id)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "entries": len(self.entries)}
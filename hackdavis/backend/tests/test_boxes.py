@@ -0,0 +1,68 @@
+import time
+
+from model.boxes import GridIndex, filter_boxes, merge_tiled_boxes
+
+IMAGE_SIZE = (3840, 1920)
+FULL_FRAME = (0, 0, 3840, 1920)
+ITEMS = [[100, 100, 300, 400], [900, 200, 1100, 500], [2000, 1200, 2300, 1500]]
+
+
+def test_whole_frame_box_does_not_swallow_the_items_inside_it():
+    boxes = [[0, 0, 3840, 1920]] + ITEMS
+    scores = [0.4, 0.35, 0.3, 0.2]
+    tiles = [FULL_FRAME, (0, 0, 640, 640), (640, 0, 1280, 640), (1920, 1152, 2560, 1792)]
+
+    keep = merge_tiled_boxes(boxes, scores, tiles, IMAGE_SIZE)
+
+    assert sorted(keep) == [1, 2, 3]
+    assert filter_boxes([boxes[idx] for idx in keep], [scores[idx] for idx in keep], IMAGE_SIZE) == [0, 1, 2]
+
+
+def test_shelf_sized_box_keeps_uncut_items():
+    boxes = [[0, 0, 1600, 900]] + ITEMS[:2]
+    scores = [0.6, 0.3, 0.25]
+    tiles = [FULL_FRAME, (0, 0, 640, 640), (640, 0, 1280, 640)]
+
+    assert sorted(merge_tiled_boxes(boxes, scores, tiles, IMAGE_SIZE)) == [0, 1, 2]
+
+
+def test_box_cut_by_a_tile_edge_merges_into_the_whole_object():
+    whole = [500, 100, 800, 400]
+    # The left tile ends at x=640 and only sees the left part of the object
+    partial = [500, 100, 640, 400]
+    tiles = [(384, 0, 1024, 640), (0, 0, 640, 640)]
+
+    assert merge_tiled_boxes([whole, partial], [0.5, 0.3], tiles, IMAGE_SIZE) == [0]
+    # A higher scoring partial box gives way to the whole one
+    assert merge_tiled_boxes([whole, partial], [0.3, 0.5], tiles, IMAGE_SIZE) == [0]
+
+
+def test_duplicates_from_overlapping_tiles_are_suppressed():
+    boxes = [[700, 100, 900, 300], [702, 101, 901, 302]]
+    tiles = [(512, 0, 1152, 640), (640, 0, 1280, 640)]
+
+    assert merge_tiled_boxes(boxes, [0.3, 0.5], tiles, IMAGE_SIZE) == [1]
+
+
+def test_huge_query_rectangle_scans_the_boxes_instead_of_the_grid():
+    index = GridIndex()
+    for idx, box in enumerate(ITEMS):
+        index.insert(idx, box)
+
+    start = time.perf_counter()
+    assert index.query_rect([0, 0, 400000, 400000]) == [0, 1, 2]
+    assert index.query_rect([0, 0, float("inf"), float("inf")]) == [0, 1, 2]
+    assert time.perf_counter() - start < 0.1
+
+
+def test_huge_box_is_indexed_without_walking_its_cells():
+    index = GridIndex()
+    index.insert("item", ITEMS[0])
+    start = time.perf_counter()
+    index.insert("huge", [0, 0, 10 ** 7, 10 ** 7])
+    assert time.perf_counter() - start < 0.1
+
+    assert index.query_point(150, 150) == ["item", "huge"]
+    assert index.query_rect([5000, 5000, 5100, 5100]) == ["huge"]
+    index.remove("huge")
+    assert index.query_rect([5000, 5000, 5100, 5100]) == []
@@ -0,0 +1,53 @@
+import pytest
+
+from detection_store import DetectionStore, check_box
+
+
+def test_check_box_accepts_a_valid_box():
+    assert check_box([10, 20, 110.7, 220]) == "[10, 20, 110, 220]"
+
+
+@pytest.mark.parametrize("box", [
+    None,
+    [1, 2, 3],
+    ["a", 0, 10, 10],
+    [0, 0, 400000, 400000],
+    [-5, 0, 10, 10],
+    [100, 0, 50, 10],
+    [0, 100, 10, 100],
+    [0, 0, float("inf"), 10],
+])
+def test_check_box_rejects_malformed_out_of_range_and_inverted_boxes(box):
+    with pytest.raises(ValueError):
+        check_box(box)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DetectionStore(str(tmp_path / "detections.sqlite3"))
+
+
+def test_apply_returns_the_version_and_set_it_wrote(store):
+    version = store.replace("a.jpg", {1: {"label": "rice", "box": [0, 0, 10, 10]}})
+
+    new_version, detections = store.apply("a.jpg", version, [
+        {"op": "relabel", "id": 1, "label": "beans"},
+        {"op": "add", "label": "oats", "box": [20, 20, 40, 40]},
+    ])
+
+    assert new_version == version + 1
+    assert detections == {1: {"label": "beans", "box": [0, 0, 10, 10]}, 2: {"label": "oats", "box": [20, 20, 40, 40]}}
+    assert store.get("a.jpg") == (new_version, detections)
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "relabel", "label": "beans"},
+    {"op": "move", "box": [0, 0, 5, 5]},
+    {"op": "delete"},
+])
+def test_apply_rejects_edits_without_an_id(store, operation):
+    version = store.replace("a.jpg", {1: {"label": "rice", "box": [0, 0, 10, 10]}})
+
+    with pytest.raises(ValueError, match="needs an id"):
+        store.apply("a.jpg", version, [operation])
+    assert store.version("a.jpg") == version
@@ -0,0 +1,62 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import jobs
+
+
+class FakeExecutor:
+    """Stands in for ProcessPoolExecutor; the first `broken` instances refuse every submit."""
+
+    created = []
+    broken = 0
+
+    def __init__(self, **kwargs):
+        self.is_broken = len(FakeExecutor.created) < FakeExecutor.broken
+        self.shut_down = False
+        FakeExecutor.created.append(self)
+
+    def submit(self, fn, *args):
+        if self.is_broken:
+            raise BrokenProcessPool("A child process terminated abruptly")
+        future = Future()
+        future.set_result(({1: {"label": "rice", "box": [0, 0, 10, 10]}}, None))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def make_queue(monkeypatch, broken):
+    FakeExecutor.created = []
+    FakeExecutor.broken = broken
+    monkeypatch.setattr(jobs, "ProcessPoolExecutor", FakeExecutor)
+    monkeypatch.setattr(jobs, "load_result", lambda filename: None)
+    queue = jobs.ScanJobQueue()
+    # Skip spawning a multiprocessing manager
+    queue.manager = object()
+    queue.progress = {}
+    queue.executor = FakeExecutor()
+    return queue
+
+
+def test_broken_pool_is_replaced_and_the_scan_submitted(monkeypatch):
+    queue = make_queue(monkeypatch, broken=1)
+
+    job = queue.submit("abc.jpg")
+
+    assert job["status"] != "error"
+    assert queue.get("abc.jpg")["status"] == "completed"
+    assert len(FakeExecutor.created) == 2
+    assert FakeExecutor.created[0].shut_down
+
+
+def test_job_is_marked_failed_when_the_new_pool_is_broken_too(monkeypatch):
+    queue = make_queue(monkeypatch, broken=2)
+
+    job = queue.submit("abc.jpg")
+
+    assert job["status"] == "error"
+    assert "BrokenProcessPool" in job["error"]
+    # A later upload of the same bytes retries instead of returning the dead job
+    FakeExecutor.broken = 0
+    assert queue.submit("abc.jpg")["job_id"] != job["job_id"]
@@ -0,0 +1,44 @@
+import pytest
+
+from model.labels import normalize_label, singularize
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("cookies", "cookie"),
+    ("pies", "pie"),
+    ("brownies", "brownie"),
+    ("smoothies", "smoothie"),
+    ("veggies", "veggie"),
+    ("cherries", "cherry"),
+    ("berries", "berry"),
+    ("candies", "candy"),
+    ("oats", "oat"),
+    ("beans", "bean"),
+    ("noodles", "noodle"),
+    ("peaches", "peach"),
+    ("boxes", "box"),
+    ("potatoes", "potato"),
+    ("tomatoes", "tomato"),
+    ("loaves", "loaf"),
+    ("crackers", "cracker"),
+    ("eggs", "egg"),
+])
+def test_plural_and_singular_normalize_to_the_same_item(plural, singular):
+    assert singularize(plural) == singular
+    assert normalize_label(plural) == normalize_label(singular)
+
+
+@pytest.mark.parametrize("word", ["hummus", "couscous", "asparagus", "molasses", "swiss", "rice", "pasta"])
+def test_words_that_are_not_plurals_are_kept(word):
+    assert singularize(word) == word
+
+
+def test_case_whitespace_and_synonyms_are_folded():
+    assert normalize_label("  Whole grain  Pasta elbows ") == normalize_label("whole grain pasta elbow")
+    assert normalize_label("Marinara Sauce") == normalize_label("pasta sauces")
+    assert normalize_label("Oatmeal Cookies") == "oatmeal cookie"
+
+
+def test_null_label_is_empty():
+    assert normalize_label("NULL") == ""
+    assert normalize_label(" ") == ""
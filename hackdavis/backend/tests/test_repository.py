@@ -0,0 +1,99 @@
+import asyncio
+import importlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import repository
+
+
+class SlowQuery:
+    """Stands in for a supabase query builder; execute() blocks like a slow network round trip."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        with self.client.lock:
+            self.client.in_flight += 1
+            self.client.max_in_flight = max(self.client.max_in_flight, self.client.in_flight)
+        time.sleep(self.client.delay)
+        with self.client.lock:
+            self.client.in_flight -= 1
+        return SimpleNamespace(data=[{"id": 1}])
+
+
+class SlowClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def table(self, name):
+        return SlowQuery(self)
+
+
+async def max_ticker_lag(interval, until):
+    """Sleep in a loop until `until` is done; return the worst overshoot of the requested interval."""
+    worst = 0.0
+    while not until.done():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+def test_event_loop_stays_responsive_during_slow_queries():
+    client = SlowClient(delay=0.3)
+    repo = repository.ResidentRepository(client, timeout=5)
+
+    async def scenario():
+        queries = asyncio.gather(*[repo.find_by_name(f"resident {i}") for i in range(12)])
+        lag = await max_ticker_lag(0.01, queries)
+        return lag, await queries
+
+    lag, results = asyncio.run(scenario())
+
+    assert [result.data for result in results] == [[{"id": 1}]] * 12
+    # A blocking client on the loop would stall the ticker for the whole 0.3s query
+    assert lag < 0.1
+    # Queries ran concurrently, but never beyond the bounded pool
+    assert 1 < client.max_in_flight <= repository.DB_MAX_WORKERS
+
+
+def test_slow_query_times_out():
+    repo = repository.ResidentRepository(SlowClient(delay=1.0), timeout=0.1)
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(repo.find_by_name("resident"))
+    assert time.perf_counter() - start < 0.9
+
+
+def test_db_timeout_setting_applies_by_default(monkeypatch):
+    monkeypatch.setenv("DB_TIMEOUT", "0.1")
+    module = importlib.reload(repository)
+    try:
+        repo = module.ResidentRepository(SlowClient(delay=1.0))
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(repo.find_by_name("resident"))
+    finally:
+        monkeypatch.delenv("DB_TIMEOUT")
+        importlib.reload(repository)
+
+
+def test_blocking_callers_share_the_pool_and_timeout():
+    client = SlowClient(delay=1.0)
+    repo = repository.EmergencyLogRepository(client, timeout=0.1)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        repo.latest_pending_sync()
+    assert time.perf_counter() - start < 0.9
+
+    fast = repository.ResidentRepository(SlowClient(delay=0.0), timeout=1)
+    assert fast.find_by_id_sync(1).data == [{"id": 1}]
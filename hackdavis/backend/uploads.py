@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+IMG_TO_PREDICT_DIR = DATA_DIR / "img_to_predict"
+DETECTIONS_DIR = DATA_DIR / "detections"
+UPLOADS_DB_PATH = os.getenv("UPLOADS_DB_PATH", str(DATA_DIR / "uploads.sqlite3"))
+
+CHUNK_SIZE = 1024 * 1024
+VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm"}
+
+
+def content_name_for(content_hash, filename):
+    """Name an image by its content hash, keeping the original extension for decoders and browsers."""
+    extension = os.path.splitext(filename)[1].lower() or ".jpg"
+    return f"{content_hash}{extension}"
+
+
+def is_video(name):
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def result_name_for(content_name):
+    """Name of the rendered result in data/result: the image itself, or a JPEG contact sheet for a video."""
+    if is_video(content_name):
+        return f"{os.path.splitext(content_name)[0]}.jpg"
+    return content_name
+
+
+def save_result(content_name, detections):
+    """Store the detection set of a finished scan next to the annotated image (called from scan workers)."""
+    os.makedirs(DETECTIONS_DIR, exist_ok=True)
+    path = DETECTIONS_DIR / f"{os.path.splitext(content_name)[0]}.json"
+    with tempfile.NamedTemporaryFile("w", dir=DETECTIONS_DIR, suffix=".tmp", delete=False) as f:
+        json.dump(detections, f)
+    os.replace(f.name, path)
+
+
+def load_result(content_name):
+    path = DETECTIONS_DIR / f"{os.path.splitext(content_name)[0]}.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        # JSON turns the integer detection ids into strings
+        return {int(key): value for key, value in json.load(f).items()}
+
+
+class UploadStore:
+    """Content-addressed image uploads: the SHA-256 of the bytes is the identity, filenames are aliases."""
+
+    def __init__(self, db_path=UPLOADS_DB_PATH):
+        os.makedirs(IMG_TO_PREDICT_DIR, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS uploads (
+            filename TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            content_name TEXT NOT NULL,
+            created_at REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS uploads_content_hash ON uploads (content_hash)")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS pantries (
+            pantry_id TEXT PRIMARY KEY,
+            content_name TEXT NOT NULL,
+            updated_at REAL NOT NULL)""")
+        self.conn.commit()
+
+    def store(self, fileobj, filename):
+        """Stream an upload to disk while hashing it. Blocking, so run it in a thread pool.
+
+        Returns (content_name, is_new) where is_new is False when the same bytes
+        were uploaded before, under any filename.
+        """
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=IMG_TO_PREDICT_DIR, suffix=".part", delete=False) as tmp:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                digest.update(chunk)
+                tmp.write(chunk)
+        content_hash = digest.hexdigest()
+
+        with self.lock:
+            row = self.conn.execute("SELECT content_name FROM uploads WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+            content_name = row[0] if row else content_name_for(content_hash, filename)
+            is_new = not (IMG_TO_PREDICT_DIR / content_name).exists()
+            if is_new:
+                os.replace(tmp.name, IMG_TO_PREDICT_DIR / content_name)
+            else:
+                os.unlink(tmp.name)
+            self.conn.execute("INSERT OR REPLACE INTO uploads (filename, content_hash, content_name, created_at) VALUES (?, ?, ?, ?)",
+                              (filename, content_hash, content_name, time.time()))
+            self.conn.commit()
+        return content_name, is_new
+
+    def resolve(self, filename):
+        """Map an uploaded filename to its content name; unknown names are returned unchanged."""
+        with self.lock:
+            row = self.conn.execute("SELECT content_name FROM uploads WHERE filename = ?", (filename,)).fetchone()
+        return row[0] if row else filename
+
+    def latest_scan(self, pantry_id):
+        """Content name of the last image uploaded for a pantry, if any."""
+        with self.lock:
+            row = self.conn.execute("SELECT content_name FROM pantries WHERE pantry_id = ?", (pantry_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_latest_scan(self, pantry_id, content_name):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO pantries (pantry_id, content_name, updated_at) VALUES (?, ?, ?)",
+                              (pantry_id, content_name, time.time()))
+            self.conn.commit()
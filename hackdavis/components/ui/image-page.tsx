@@ -70,8 +70,12 @@ export default function ExampleUsagePage({
       try {
         console.log("I got here");
         const res = await fetch(
-          `http://localhost:8000/refresh-detections/${filename}`
+          `http://localhost:8000/get-detections/${filename}`
         );
+        if (!res.ok) {
+          console.error("No detections for", filename, res.status);
+          return;
+        }
         const data = await res.json();
         setDetectionData(data);
       } catch (err) {
@@ -94,7 +98,7 @@ export default function ExampleUsagePage({
 
   const removeFromBackend = async (id: number) => {
     try {
-      await fetch(`http://localhost:8000/remove-detection/${id}`, {
+      await fetch(`http://localhost:8000/remove-detection/${imageFilename}/${id}`, {
         method: "DELETE",
       });
       console.log(`Deleted detection ${id}`);